@@ -0,0 +1,20 @@
+"""
+Please execute this module with "manage.py" (e.g. periodically) to set
+the counters of favorites of the products from the users' favorites,
+in case they have drifted (e.g. favorites changed from the admin site,
+or users deleted).
+"""
+
+from django.core.management.base import BaseCommand
+
+from auth.models import Favorite
+
+
+class Command(BaseCommand):
+    help = 'Set the counters of favorites of the products'
+
+    def handle(self, *args, **options):
+        nb_products = Favorite.reconcile_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Compteurs de favoris corrigés pour {nb_products} produits."
+        ))
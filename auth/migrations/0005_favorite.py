@@ -0,0 +1,46 @@
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0016_product_search_vector'),
+        ('my_auth', '0004_auto_20200330_2040'),
+    ]
+
+    operations = [
+        # the model of the existing association table (no change in database)
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='Favorite',
+                    fields=[
+                        ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='off_sub.Product')),
+                        ('user', models.ForeignKey(db_column='myuser_id', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'my_auth_myuser_favorites',
+                        'unique_together': {('user', 'product')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='myuser',
+                    name='favorites',
+                    field=models.ManyToManyField(blank=True, related_name='interested_users', through='my_auth.Favorite', to='off_sub.Product'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='favorite',
+            index=models.Index(fields=['user', 'created_at'], name='favorite_user_date_idx'),
+        ),
+    ]
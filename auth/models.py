@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
 from django.contrib.auth.models import (
     BaseUserManager, AbstractBaseUser
 )
+from django.utils import timezone
 
 from off_sub.models import Product
 
@@ -54,9 +56,10 @@ class MyUser(AbstractBaseUser):
         max_length=30,
         verbose_name='Prénom'
     )
-    # create association table my_auth_myuser_favorites in database
+    # association table my_auth_myuser_favorites in database
     favorites = models.ManyToManyField(
         Product,
+        through='Favorite',
         related_name='interested_users',
         blank=True
     )
@@ -70,6 +73,16 @@ class MyUser(AbstractBaseUser):
     def __str__(self):
         return f"{self.first_name} ({self.email})"
 
+    def get_favorite_ids(self, products):
+        "Which of the `products` are among the user's favorites? (set of id)"
+        # one query on the association table, restricted to the products
+        return set(
+            Favorite.objects.filter(
+                user=self,
+                product_id__in=[prod.id for prod in products]
+            ).values_list('product_id', flat=True)
+        )
+
     def has_perm(self, perm, obj=None):
         "Does the user have a specific permission?"
         # Simplest possible answer: Yes, always
@@ -85,3 +98,226 @@ class MyUser(AbstractBaseUser):
         "Is the user a member of staff?"
         # Simplest possible answer: All admins are staff
         return self.is_admin
+
+
+class Favorite(models.Model):
+    """A product saved by a user, with the date of the saving."""
+    # the table was created for the former (automatic) association table
+    user = models.ForeignKey(
+        MyUser,
+        on_delete=models.CASCADE,
+        db_column='myuser_id'
+    )
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    # orderings of the favorites pages, ending with an unique field
+    SORTS = {
+        'recent': ('-created_at', '-id'),
+        'oldest': ('created_at', 'id'),
+        'nutriscore': ('product__nutriscore_score', 'id'),
+    }
+    # number of favorites per page
+    PAGE_SIZE = 12
+
+    class Meta:
+        db_table = 'my_auth_myuser_favorites'
+        unique_together = [('user', 'product')]
+        indexes = [
+            # favorites of a user by date ('get_page')
+            models.Index(
+                fields=['user', 'created_at'], name='favorite_user_date_idx'
+            ),
+        ]
+
+    @classmethod
+    def add_favorites(cls, user, product_ids):
+        """
+        Save the products (list of id) as favorites of the user, with one
+        insert, the products already saved being ignored, and update their
+        counters of favorites.
+        Return the list of the id of the existing products.
+        """
+        # the unknown products are left out (without loading them)
+        states = cls._get_states(user, product_ids)
+        new_ids = [prod_id for prod_id, saved in states.items() if not saved]
+        if new_ids:
+            with transaction.atomic():
+                # only the favorites actually inserted are counted
+                saved_ids = cls._lock_saved_ids(user, new_ids)
+                new_ids = [pid for pid in new_ids if pid not in saved_ids]
+                cls.objects.bulk_create(
+                    [cls(user=user, product_id=pid) for pid in new_ids],
+                    ignore_conflicts=True
+                )
+                cls._update_counts(new_ids, 1)
+        return list(states)
+
+    @classmethod
+    def remove_favorites(cls, user, product_ids):
+        """
+        Unsave the products (list of id) from the favorites of the user,
+        with one delete, and update their counters of favorites.
+        Return the number of favorites removed.
+        """
+        favs = cls.objects.filter(user=user, product_id__in=product_ids)
+        saved_ids = list(favs.values_list('product_id', flat=True))
+        if saved_ids:
+            with transaction.atomic():
+                # only the favorites actually deleted are counted
+                saved_ids = list(cls._lock_saved_ids(user, saved_ids))
+                favs.filter(product_id__in=saved_ids).delete()
+                cls._update_counts(saved_ids, -1)
+        return len(saved_ids)
+
+    @classmethod
+    def set_favorite(cls, user, product_id, saved):
+        """
+        Save (if 'saved') or unsave the product as a favorite of the user,
+        and update its counter of favorites.
+        The state of the favorite is read first (with the product, in one
+        query): nothing is written if it is already the requested state.
+        Return True if the favorite changed, False if not,
+        or None if the product does not exist.
+        """
+        current = cls._get_states(user, [product_id]).get(product_id)
+        if current is None or current == saved:
+            return None if current is None else False
+        with transaction.atomic():
+            # the state may have changed since (e.g. concurrent requests)
+            current = product_id in cls._lock_saved_ids(user, [product_id])
+            if current == saved:
+                return False
+            if saved:
+                cls.objects.bulk_create(
+                    [cls(user=user, product_id=product_id)],
+                    ignore_conflicts=True
+                )
+            else:
+                cls.objects.filter(
+                    user=user, product_id=product_id
+                ).delete()
+            cls._update_counts([product_id], 1 if saved else -1)
+        return True
+
+    @classmethod
+    def _get_states(cls, user, product_ids):
+        """
+        Return a dict {product id: True if saved by the user, else False}
+        of the existing products among 'product_ids', with one query.
+        """
+        return dict(
+            Product.objects.filter(id__in=product_ids).annotate(
+                saved=Exists(cls.objects.filter(
+                    user=user, product_id=OuterRef('pk')
+                ))
+            ).values_list('id', 'saved')
+        )
+
+    @classmethod
+    def _lock_saved_ids(cls, user, product_ids):
+        """
+        Lock the products (until the end of the transaction), so that the
+        changes of their favorites are serialized, then return the set of
+        the id of the products saved by the user among 'product_ids'.
+        """
+        list(
+            Product.objects.select_for_update().filter(
+                id__in=product_ids
+            ).order_by('id').values_list('id', flat=True)
+        )
+        return set(
+            cls.objects.filter(
+                user=user, product_id__in=product_ids
+            ).values_list('product_id', flat=True)
+        )
+
+    @staticmethod
+    def _update_counts(product_ids, delta):
+        """
+        Add 'delta' to the counters of favorites of the products,
+        in the database (without reading them).
+        """
+        prods = Product.objects.filter(id__in=product_ids)
+        if delta < 0:
+            # a counter never gets negative (see 'reconcile_counts')
+            prods = prods.filter(favorites_count__gte=-delta)
+        prods.update(favorites_count=F('favorites_count') + delta)
+
+    @classmethod
+    def reconcile_counts(cls, batch_size=500):
+        """
+        Set the counters of favorites of the products from the favorites
+        (e.g. after changes outside of the methods of this class), with
+        one update per batch of products with the same (wrong) counter.
+        Return the number of products updated.
+        """
+        counts = dict(
+            cls.objects.values('product_id').annotate(
+                count=Count('id')
+            ).values_list('product_id', 'count')
+        )
+        # products id by (new) counter
+        changes = {}
+        for prod_id, old_count in Product.objects.values_list(
+            'id', 'favorites_count'
+        ).iterator():
+            count = counts.get(prod_id, 0)
+            if count != old_count:
+                changes.setdefault(count, []).append(prod_id)
+        updated = 0
+        for count, prods_id in changes.items():
+            for start in range(0, len(prods_id), batch_size):
+                updated += Product.objects.filter(
+                    id__in=prods_id[start:start + batch_size]
+                ).update(favorites_count=count)
+        return updated
+
+    @classmethod
+    def filter_favorites(cls, user, grade=None, category_id=None):
+        """
+        Return a queryset with the favorites of the user, optionally
+        restricted to a nutriscore grade and/or a category.
+        """
+        favs = cls.objects.filter(user=user)
+        if grade:
+            favs = favs.filter(product__nutriscore_grade=grade)
+        if category_id is not None:
+            favs = favs.filter(product__categories=category_id)
+        return favs
+
+    @classmethod
+    def get_page(cls, favs, sort, after=None, size=PAGE_SIZE):
+        """
+        Return the page of the favorites 'favs' (a list, with their product)
+        which follows the favorite of id 'after' in the ordering 'sort',
+        and the id of its last favorite if there is a next page (else None).
+        The pages are selected by their bounds (keyset pagination), hence
+        with a constant cost, whatever the number of favorites.
+        """
+        ordering = cls.SORTS[sort]
+        if after is not None:
+            fields = [field.lstrip('-') for field in ordering]
+            anchor = favs.filter(id=after).values(*fields).first()
+            if anchor is not None:
+                favs = favs.filter(cls._after(ordering, anchor))
+        page = list(
+            favs.select_related('product').order_by(*ordering)[:size + 1]
+        )
+        next_after = page[size - 1].id if len(page) > size else None
+        return page[:size], next_after
+
+    @staticmethod
+    def _after(ordering, anchor):
+        """
+        Return the condition (Q object) of the records following
+        the 'anchor' (dict of values) in the 'ordering'.
+        """
+        condition = Q()
+        equal = {}
+        for field in ordering:
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': anchor[name]})
+            equal[name] = anchor[name]
+        return condition
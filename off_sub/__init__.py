@@ -0,0 +1 @@
+default_app_config = "off_sub.apps.OffSubConfig"
@@ -1,14 +1,60 @@
 import re
+from datetime import datetime, timezone
+from urllib.parse import urlencode
 
+from django.contrib.auth.decorators import user_passes_test
+from django.db.models import Q
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST, \
+    require_safe
 
-from off_sub.models import Product
+from auth.models import Favorite
+from off_sub.barcodes import find_exact_product_id, find_product_id
+from off_sub.catalogue_cache import get_cache_stats, get_catalogue_version
+from off_sub.models import Product, ProductSubstitute
+from off_sub.params import parse_id
+
+
+# maximum number of products resolved at once
+RESOLVE_MAX = 100
+# number of substitutes returned per product, by default
+RESOLVE_NB_SUB = 3
+# maximum number of favorites saved/unsaved at once
+FAVORITES_MAX = 500
+# number of substitutes returned for a product, by default
+SUBSTITUTES_NB_SUB = 6
+# lifetime (in seconds) of the substitutes in the browsers
+# and in the shared caches (CDN, proxies), before a revalidation
+SUBSTITUTES_MAX_AGE = 60
+SUBSTITUTES_S_MAXAGE = 600
+# fields of the products returned by the views of this module
+PRODUCT_DATA_FIELDS = [
+    'id',
+    'code',
+    'product_name',
+    'nutriscore_grade',
+    'nutriscore_score',
+]
+
+
+@user_passes_test(lambda user: user.is_staff)
+def ajax_cache_stats(request):
+    """
+    This view is used to monitor the catalogue cache of the worker
+    (hit/miss counters of the cached pages), for staff members only.
+    This is not linked to a template.
+    """
+    return JsonResponse(get_cache_stats())
 
 
 def ajax_find_product(request):
     """
     This view is used to find the product searched by the user.
+    If the user did not pick a suggestion, the url of the search page
+    is returned instead of the product id.
     This is not linked to a template.
     """
     data = {}
@@ -21,12 +67,183 @@ def ajax_find_product(request):
             product_string
         )
         if match:
+            # the exact code, from the barcodes map (fast path)...
             product_code = match.group(1)
+            product_id = find_exact_product_id(product_code)
+            if product_id is None:
+                # ... or from the database
+                product_id = Product.objects.filter(
+                    code=product_code
+                ).values_list('id', flat=True).first()
+        else:
+            # maybe a raw barcode (e.g. typed or read by a scanner)
+            try:
+                product_id = find_product_id(product_string)
+            except ValueError:
+                product_id = None
+        if product_id is not None:
+            data['product_id'] = product_id
         else:
-            product_code = 0
-        # find the product id
-        product = get_object_or_404(Product, code=product_code)
-        data['product_id'] = product.id
+            data['search_url'] = reverse('off_sub:search') + "?" \
+                + urlencode({'q': product_string.strip()})
+    return JsonResponse(data)
+
+
+def ajax_find_barcode(request):
+    """
+    This view is used to find a product by its barcode (EAN-8, UPC-A,
+    EAN-13 or GTIN-14), without any database query in general.
+    This is not linked to a template.
+    """
+    data = {}
+    # get data from Javascript (or from a scanner-driven client)
+    code = request.GET.get('code', "")
+    try:
+        product_id = find_product_id(code)
+    except ValueError:
+        data['error'] = "invalid barcode"
+        return JsonResponse(data, status=400)
+    if product_id is None:
+        data['error'] = "unknown barcode"
+        return JsonResponse(data, status=404)
+    data['product_id'] = product_id
+    return JsonResponse(data)
+
+
+def ajax_resolve_products(request):
+    """
+    This view is used to resolve a batch of products (e.g. a shopping
+    list), given by codes and/or id (parameters 'codes' and 'ids', lists
+    separated by commas), with their best (precomputed) substitutes,
+    with a constant number of queries.
+    This is not linked to a template.
+    """
+    data = {}
+    # get data from Javascript (or from a mobile client)
+    codes = _get_list(request.GET, 'codes')
+    ids = _get_list(request.GET, 'ids')
+    if len(codes) + len(ids) > RESOLVE_MAX:
+        data['error'] = f"at most {RESOLVE_MAX} products"
+        return JsonResponse(data, status=400)
+    nb_sub = _get_nb_sub(request, RESOLVE_NB_SUB, 0)
+    # the valid barcodes are resolved without query...
+    codes_id = {}
+    for code in codes:
+        try:
+            codes_id[code] = find_product_id(code)
+        except ValueError:
+            codes_id[code] = None
+    # ... the other products with one query
+    ids_value = {value: parse_id(value) for value in ids}
+    prods_id = [prod_id for prod_id in ids_value.values() if prod_id]
+    prods_id += [prod_id for prod_id in codes_id.values() if prod_id]
+    other_codes = [code for code, prod_id in codes_id.items() if not prod_id]
+    by_id = {
+        prod.id: prod
+        for prod in Product.objects.filter(
+            Q(id__in=prods_id) | Q(code__in=other_codes)
+        ).only(*PRODUCT_DATA_FIELDS)
+    }
+    by_code = {prod.code: prod for prod in by_id.values()}
+    # best substitutes of all the products, with one query
+    subs = {}
+    if nb_sub:
+        subs_qs = ProductSubstitute.objects.filter(
+            product_id__in=by_id, rank__lt=nb_sub
+        ).select_related('substitute').only(
+            'product_id',
+            *[f'substitute__{field}' for field in PRODUCT_DATA_FIELDS]
+        ).order_by('product_id', 'rank')
+        for sub in subs_qs:
+            subs.setdefault(sub.product_id, []).append(
+                _product_data(sub.substitute)
+            )
+    # answer in the order of the request
+    requested = [
+        (code, by_id.get(codes_id[code]) or by_code.get(code))
+        for code in codes
+    ]
+    requested += [
+        (value, by_id.get(ids_value[value]))
+        for value in ids
+    ]
+    data['products'] = []
+    data['not_found'] = []
+    for key, prod in requested:
+        if prod is None:
+            data['not_found'].append(key)
+            continue
+        prod_data = _product_data(prod)
+        prod_data['substitutes'] = subs.get(prod.id, [])
+        data['products'].append(prod_data)
+    return JsonResponse(data)
+
+
+def _substitutes_etag(request, product_id):
+    """
+    Return the (strong) ETag of the substitutes of a product: they only
+    change with the catalogue version.
+    """
+    nb_sub = _get_nb_sub(request, SUBSTITUTES_NB_SUB, 1)
+    return f"{product_id}-{nb_sub}-{get_catalogue_version()}"
+
+
+def _substitutes_last_modified(request, product_id):
+    """
+    Return the date of the last change of the substitutes of a product,
+    i.e. of the catalogue version (a timestamp in milliseconds).
+    """
+    return datetime.fromtimestamp(
+        get_catalogue_version() / 1000, tz=timezone.utc
+    )
+
+
+@require_safe
+@cache_control(
+    public=True,
+    max_age=SUBSTITUTES_MAX_AGE,
+    s_maxage=SUBSTITUTES_S_MAXAGE
+)
+@condition(
+    etag_func=_substitutes_etag,
+    last_modified_func=_substitutes_last_modified
+)
+def ajax_substitutes(request, product_id):
+    """
+    This view is used to get the best substitutes of a product
+    (parameter 'nb_sub'), in JSON.
+    The answer can be cached by the clients and the proxies: it is
+    revalidated with its ETag or its date, and a 304 (Not Modified) answer
+    is returned while the catalogue is unchanged.
+    This is not linked to a template.
+    """
+    data = {}
+    nb_sub = _get_nb_sub(request, SUBSTITUTES_NB_SUB, 1)
+    product = get_object_or_404(
+        Product.objects.only(*PRODUCT_DATA_FIELDS), id=product_id
+    )
+    data['product'] = _product_data(product)
+    data['substitutes'] = [
+        _product_data(sub) for sub in product.get_best_subs(nb_sub)
+    ]
+    return JsonResponse(data)
+
+
+def ajax_suggest(request):
+    """
+    This view is used to suggest products matching the user's input,
+    for the autocompletion of the search fields.
+    This is not linked to a template.
+    """
+    data = {}
+    # get data from Javascript
+    term = request.GET.get('q', "")
+    try:
+        limit = int(request.GET.get('limit', Product.SUGGESTIONS_LIMIT))
+    except ValueError:
+        limit = Product.SUGGESTIONS_LIMIT
+    limit = max(1, min(limit, Product.SUGGESTIONS_MAX))
+    data['suggestions'] = Product.get_suggestions(term, limit)
     return JsonResponse(data)
 
 
@@ -38,25 +255,173 @@ def ajax_save_product(request):
     data = {}
     # get data from Javascript
     if request.method == 'POST':
-        product_id = request.POST.get('product_id', 0)
-        product = get_object_or_404(Product, id=product_id)
+        product_id = _get_favorite_id(request)
+        if product_id is None:
+            return _favorite_error(request)
         # add the product to the list of favorites for the user
-        request.user.favorites.add(product)
+        if not Favorite.add_favorites(request.user, [product_id]):
+            data['error'] = "unknown product"
+            return JsonResponse(data, status=404)
         data['product_id'] = product_id
     return JsonResponse(data)
 
 
 def ajax_unsave_product(request):
     """
-    This view is used to unsave a product from the user's favorites.
+    This view is used to unsave a product from the user's favorites
+    (nothing is deleted if the product is unknown or not saved).
     This is not linked to a template.
     """
     data = {}
     # get data from Javascript
     if request.method == 'POST':
-        product_id = request.POST.get('product_id', 0)
-        product = get_object_or_404(Product, id=product_id)
-        # add the product to the list of favorites for the user
-        request.user.favorites.remove(product)
+        product_id = _get_favorite_id(request)
+        if product_id is None:
+            return _favorite_error(request)
+        # remove the product from the list of favorites for the user
+        Favorite.remove_favorites(request.user, [product_id])
         data['product_id'] = product_id
     return JsonResponse(data)
+
+
+@require_POST
+def ajax_set_favorite(request):
+    """
+    This view is used to set the state of a user's favorite (parameters
+    'product_id' and 'saved', "true" or "false"): the request can be
+    repeated without effect, and nothing is written in the database
+    if the favorite is already in this state.
+    This is not linked to a template.
+    """
+    data = {}
+    if not request.user.is_authenticated:
+        data['error'] = "authentication required"
+        return JsonResponse(data, status=403)
+    product_id = parse_id(request.POST.get('product_id', ""))
+    saved = request.POST.get('saved', "")
+    if product_id is None or saved not in ('true', 'false'):
+        data['error'] = "invalid product_id or saved"
+        return JsonResponse(data, status=400)
+    changed = Favorite.set_favorite(
+        request.user, product_id, saved == 'true'
+    )
+    if changed is None:
+        data['error'] = "unknown product"
+        return JsonResponse(data, status=404)
+    data['product_id'] = product_id
+    data['saved'] = saved == 'true'
+    data['changed'] = changed
+    return JsonResponse(data)
+
+
+@require_POST
+def ajax_save_products(request):
+    """
+    This view is used to save several products (parameter 'product_ids',
+    list separated by commas) as a user's favorites, with one insert,
+    e.g. to synchronize the favorites saved offline.
+    This is not linked to a template.
+    """
+    data = {}
+    product_ids = _get_favorites_ids(request)
+    if product_ids is None:
+        return _favorites_error(request)
+    saved = Favorite.add_favorites(request.user, product_ids)
+    data['product_ids'] = saved
+    data['not_found'] = sorted(set(product_ids) - set(saved))
+    return JsonResponse(data)
+
+
+@require_POST
+def ajax_unsave_products(request):
+    """
+    This view is used to unsave several products (parameter 'product_ids',
+    list separated by commas) from the user's favorites, with one delete.
+    This is not linked to a template.
+    """
+    data = {}
+    product_ids = _get_favorites_ids(request)
+    if product_ids is None:
+        return _favorites_error(request)
+    data['product_ids'] = product_ids
+    data['deleted'] = Favorite.remove_favorites(request.user, product_ids)
+    return JsonResponse(data)
+
+
+# functions called in the views
+def _product_data(prod):
+    """
+    Return the data of a product (dict), serializable in JSON.
+    """
+    return {field: getattr(prod, field) for field in PRODUCT_DATA_FIELDS}
+
+
+def _get_favorite_id(request):
+    """
+    Return the product id of a favorite request,
+    or None if the request is not valid.
+    """
+    if not request.user.is_authenticated:
+        return None
+    return parse_id(request.POST.get('product_id', ""))
+
+
+def _favorite_error(request):
+    """
+    Return the error response of a favorite request.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "authentication required"}, status=403)
+    return JsonResponse({'error': "invalid product_id"}, status=400)
+
+
+def _get_favorites_ids(request):
+    """
+    Return the list of the products id of a (bulk) favorites request,
+    or None if the request is not valid.
+    """
+    values = _get_list(request.POST, 'product_ids')
+    if not request.user.is_authenticated or len(values) > FAVORITES_MAX:
+        return None
+    product_ids = {parse_id(value) for value in values}
+    if None in product_ids:
+        return None
+    return sorted(product_ids)
+
+
+def _favorites_error(request):
+    """
+    Return the error response of a (bulk) favorites request.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': "authentication required"}, status=403)
+    return JsonResponse(
+        {'error': f"at most {FAVORITES_MAX} product id (integers)"},
+        status=400
+    )
+
+
+def _get_nb_sub(request, default, minimum):
+    """
+    Return the number of substitutes requested (parameter 'nb_sub'),
+    between 'minimum' and the number of precomputed substitutes.
+    """
+    try:
+        nb_sub = int(request.GET.get('nb_sub', default))
+    except ValueError:
+        nb_sub = default
+    return max(minimum, min(nb_sub, ProductSubstitute.NB_SUBSTITUTES))
+
+
+def _get_list(params, name):
+    """
+    Return the values of a list parameter of a request ('params' is
+    request.GET or request.POST), given as repeated parameters
+    and/or separated by commas.
+    """
+    return [
+        value.strip()
+        for param in params.getlist(name)
+        for value in param.split(",")
+        if value.strip()
+    ]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class OffSubConfig(AppConfig):
     name = 'off_sub'
+
+    def ready(self):
+        # connect the signal receivers
+        from . import signals  # noqa: F401
@@ -0,0 +1,127 @@
+"""
+This module contains the barcode lookup of the products (app 'off_sub').
+
+The barcodes (EAN-8, UPC-A, EAN-13, GTIN-14) are validated with their
+check digit, and normalized as GTIN-14 (left-padded with zeros), so that
+e.g. a UPC-A code matches the same product as its EAN-13 form.
+The exact codes are looked up first: a GTIN-14 shared by several codes
+(e.g. '123456789012' and '0123456789012') matches none of them.
+Each worker keeps in-memory maps of the codes and of the normalized codes
+to the products id, built for the current catalogue version
+(see 'catalogue_cache'): any change in the catalogue updates the version,
+hence rebuilds the maps.
+"""
+
+import threading
+
+from .catalogue_cache import get_catalogue_version
+from .models import Product
+
+
+BARCODE_LENGTHS = (8, 12, 13, 14)
+GTIN_LENGTH = 14
+
+# local (per worker) map of the codes, for the current version
+_barcodes = {}
+_lock = threading.Lock()
+
+
+def is_valid_barcode(digits):
+    """
+    Return True if the check digit (the last digit) of a barcode is valid.
+    """
+    # from the right: weight 3 for the odd positions (after the check digit)
+    total = sum(
+        int(digit) * (3 if position % 2 else 1)
+        for position, digit in enumerate(reversed(digits))
+    )
+    return total % 10 == 0
+
+
+def _clean_barcode(raw):
+    """
+    Return a barcode without its spaces and hyphens.
+    """
+    return "".join(str(raw).split()).replace("-", "")
+
+
+def normalize_barcode(raw):
+    """
+    Return a barcode (EAN-8, UPC-A, EAN-13 or GTIN-14, e.g. read by a
+    scanner) as a GTIN-14, or None if it is not a valid barcode.
+    """
+    digits = _clean_barcode(raw)
+    if not (digits.isascii() and digits.isdigit()) \
+            or len(digits) not in BARCODE_LENGTHS:
+        return None
+    if not is_valid_barcode(digits):
+        return None
+    return digits.zfill(GTIN_LENGTH)
+
+
+def _build_map():
+    """
+    Return the map of the products codes (made of ASCII digits) to their
+    id, and the map of these codes as GTIN-14 to their id, where the
+    GTIN-14 shared by several codes are mapped to None.
+    """
+    codes = {}
+    gtins = {}
+    for code, prod_id in Product.objects.values_list('code', 'id'):
+        if not (code.isascii() and code.isdigit()):
+            continue
+        codes[code] = prod_id
+        if len(code) <= GTIN_LENGTH:
+            gtin = code.zfill(GTIN_LENGTH)
+            gtins[gtin] = None if gtin in gtins else prod_id
+    return codes, gtins
+
+
+def get_barcodes_map():
+    """
+    Return the map of the products codes to their id, and the map
+    of the codes as GTIN-14 to their id (None if ambiguous), built for
+    the current catalogue version.
+    """
+    version = get_catalogue_version()
+    with _lock:
+        if _barcodes.get('version') == version:
+            return _barcodes['map']
+    barcodes_map = _build_map()
+    with _lock:
+        _barcodes['version'] = version
+        _barcodes['map'] = barcodes_map
+    return barcodes_map
+
+
+def find_product_id(raw):
+    """
+    Return the id of the product with the barcode 'raw' (its exact code,
+    else the same GTIN-14 if not ambiguous), or None if unknown.
+    Raise ValueError if it is not a valid barcode.
+    """
+    code = normalize_barcode(raw)
+    if code is None:
+        raise ValueError(f"invalid barcode: {raw}")
+    codes, gtins = get_barcodes_map()
+    prod_id = codes.get(_clean_barcode(raw))
+    if prod_id is None:
+        prod_id = gtins.get(code)
+    return prod_id
+
+
+def find_exact_product_id(code):
+    """
+    Return the id of the product with exactly the code 'code'
+    (e.g. a suggestion picked by the user), or None if unknown.
+    """
+    codes, gtins = get_barcodes_map()
+    return codes.get(code)
+
+
+def warm_barcodes():
+    """
+    Build the maps of the codes in advance (e.g. when a worker starts),
+    so that the first lookups do not hit the database.
+    """
+    get_barcodes_map()
@@ -0,0 +1,100 @@
+"""
+This module contains the cache layer of the catalogue (app 'off_sub').
+
+The cached data are versioned: any change in the catalogue updates the
+catalogue version, so that the data cached for a previous version are no
+longer used. The catalogue version is stored in the shared cache
+(setting CACHES['default']).
+"""
+
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+
+
+CATALOGUE_VERSION_KEY = 'off_sub:catalogue_version'
+PAGE_KEY = 'off_sub:page:{version}:{view}:{product_id}:{language}:{next_url}'
+# the old versions of the data are left to expire in the shared cache
+PAGE_TIMEOUT = 24 * 60 * 60
+
+_lock = threading.Lock()
+# hit/miss counters of the cached pages (per worker)
+_stats = {
+    'page_hits': 0,
+    'page_misses': 0,
+}
+
+
+def _now_version():
+    """
+    Return a version based on the current time (in milliseconds).
+    """
+    return int(time.time() * 1000)
+
+
+def get_catalogue_version():
+    """
+    Return the current catalogue version (an integer).
+    If the version is unknown (empty or evicted cache), a new one is set.
+    """
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOGUE_VERSION_KEY, _now_version(), timeout=None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Update the catalogue version, after any change in the catalogue,
+    and return the new version.
+    The version never decreases, and is at least the current time
+    (in milliseconds), so that it can also be used as a timestamp.
+    """
+    version = max(get_catalogue_version() + 1, _now_version())
+    cache.set(CATALOGUE_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def get_page_cache_key(view, product_id, language, next_url):
+    """
+    Return the key of a cached page (HTML) of a product,
+    for the current catalogue version and the parameter 'next'.
+    """
+    return PAGE_KEY.format(
+        version=get_catalogue_version(),
+        view=view,
+        product_id=product_id,
+        language=language,
+        next_url=hashlib.md5(next_url.encode()).hexdigest(),
+    )
+
+
+def get_cached_page(key):
+    """
+    Return the content of a cached page, or None if not cached.
+    """
+    content = cache.get(key)
+    with _lock:
+        _stats['page_misses' if content is None else 'page_hits'] += 1
+    return content
+
+
+def set_cached_page(key, content):
+    """
+    Record the content of a page in the shared cache.
+    """
+    cache.set(key, content, timeout=PAGE_TIMEOUT)
+
+
+def get_cache_stats():
+    """
+    Return a dict with the hit/miss counters of the current worker,
+    and the current catalogue version.
+    """
+    with _lock:
+        stats = dict(_stats)
+    stats['catalogue_version'] = get_catalogue_version()
+    return stats
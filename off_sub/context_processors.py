@@ -2,19 +2,22 @@
 This module contains the context_processors (app 'off_sub').
 """
 
-import json
+from django.utils.functional import lazy
 
-from .models import Product
+from .catalogue_cache import get_catalogue_version
 
 
-def pur_beurre_all_products(request):
+def pur_beurre_catalogue_version(request):
     """
     Return a dict, usable in the apps views as context, with
-    all products available in database.
+    the current catalogue version (a string), e.g. for the keys
+    of the cached template fragments.
+    The version is lazy: it is only read if the template uses it.
     """
-    prod_list = list(Product.objects.all())
     kwargs = {
-        'all_products': json.dumps([str(prod) for prod in prod_list])
+        'catalogue_version': lazy(
+            lambda: str(get_catalogue_version()), str
+        )()
     }
     return kwargs
 
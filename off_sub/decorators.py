@@ -0,0 +1,54 @@
+"""
+This module contains the view decorators (app 'off_sub').
+"""
+
+import re
+from functools import wraps
+
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.translation import get_language
+
+from .catalogue_cache import get_cached_page, get_page_cache_key, \
+    set_cached_page
+
+
+# the value of the hidden CSRF inputs, blanked in the cached pages
+CSRF_INPUT_RE = re.compile(
+    rb'(<input[^>]*name="csrfmiddlewaretoken"[^>]*value=")[^"]*(")'
+)
+
+
+def cache_anonymous_page(view_func):
+    """
+    Decorator for the views of a product (argument 'product_id'):
+    the pages of the anonymous users are cached, for the current
+    catalogue version (any change in the catalogue updates the version,
+    which purges the pages), the language and the parameter 'next'.
+    The requests with other parameters are not cached.
+    The CSRF tokens are blanked in the cached pages: the scripts set
+    the token of the 'csrftoken' cookie in the forms.
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, product_id, *args, **kwargs):
+        if request.user.is_authenticated \
+                or request.method not in ('GET', 'HEAD') \
+                or set(request.GET) - {'next'} \
+                or len(request.GET.getlist('next')) > 1:
+            return view_func(request, product_id, *args, **kwargs)
+        key = get_page_cache_key(
+            view_func.__name__,
+            product_id,
+            get_language(),
+            request.GET.get('next', "")
+        )
+        content = get_cached_page(key)
+        if content is not None:
+            # set the CSRF cookie, used by the forms of the page
+            get_token(request)
+            return HttpResponse(content)
+        response = view_func(request, product_id, *args, **kwargs)
+        if response.status_code == 200:
+            set_cached_page(key, CSRF_INPUT_RE.sub(rb'\1\2', response.content))
+        return response
+    return _wrapped_view
@@ -0,0 +1,399 @@
+"""
+This module contains the import pipeline of the catalogue (app 'off_sub').
+
+The products issued from Open Food Facts are normalized in memory,
+then recorded by batch (products, stores and links to the categories and
+the stores), with a constant number of queries per batch.
+The imports are incremental: a content hash is recorded with each product,
+so that the unchanged products are skipped, and only the changed fields of
+the other ones are updated.
+Note: the bulk operations do not send the models signals, so the caller
+has to update the catalogue version and the substitutes afterwards.
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import re
+import sys
+import unicodedata
+
+from django.db import transaction
+
+from .models import Category, Product, ProductSubstitute, Store
+
+
+# products containing "France" in the list of countries
+COUNTRIES_REGEXP = "(.*)[Ff]rance(.*)"
+# number of products deleted (or updated by the backfill) per query
+DELETE_BATCH_SIZE = 500
+# nutriments columns of the Open Food Facts CSV exports
+CSV_NUTRIMENTS = ['fat', 'saturated-fat', 'sugars', 'salt']
+# nutriments recorded for each product (formatted, and in grams per 100g)
+NUTRIMENTS_FIELDS = ['fat', 'saturated_fat', 'sugars', 'salt']
+# conversion of the units of the nutriments into grams
+UNITS = {
+    'g': 1,
+    'mg': 1e-3,
+    'µg': 1e-6,
+    'mcg': 1e-6,
+}
+# product fields updated when a product is imported again
+PRODUCT_FIELDS = [
+    'product_name',
+    'nutriscore_grade',
+    'nutriscore_score',
+    'fat',
+    'saturated_fat',
+    'sugars',
+    'salt',
+    'fat_100g',
+    'saturated_fat_100g',
+    'sugars_100g',
+    'salt_100g',
+    'url',
+    'image_url',
+]
+
+
+class ImportReport:
+    """
+    Counters of an import (products inserted, updated, skipped
+    because unchanged, and deleted), with the codes of the products seen.
+    """
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.deleted = 0
+        self.codes = set()
+
+    @property
+    def changed(self):
+        """
+        True if the catalogue has been changed by the import.
+        """
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def __str__(self):
+        return f"{self.inserted} ajoutés, {self.updated} mis à jour, " \
+            f"{self.skipped} inchangés, {self.deleted} supprimés"
+
+
+def normalize_item(item):
+    """
+    Return a tuple (product, store names) built from a product
+    issued from Open Food Facts (dict), or None if the product
+    does not meet the requirements.
+    """
+    # filter on:
+    # - products containing "France" in the list of countries
+    # - products with 'nutriscore_grade' and 'code' completed
+    if (re.match(COUNTRIES_REGEXP, item.get("countries", "")) is None) \
+            or ("code" not in item.keys()) \
+            or ("nutriscore_grade" not in item.keys()) \
+            or ("nutriscore_score" not in item.keys()):
+        return None
+    # set the product attributes
+    prod = Product(
+        code=item["code"],
+        product_name=item.get("product_name", "[Produit sans nom]"),
+        nutriscore_grade=item["nutriscore_grade"],
+        nutriscore_score=int(item["nutriscore_score"]),
+        url=item.get("url", ""),
+        image_url=item.get("image_url", ""),
+    )
+    if item.get("last_modified_t"):
+        prod.last_modified_t = int(item["last_modified_t"])
+    # extract some nutriments data as fat, sugars and salt
+    extract_nutriments_data(item, prod)
+    # if applicable, the stores of the product
+    shop_names = [
+        shop.strip() for shop in item.get("stores", "").split(",")
+        if shop.strip()
+    ]
+    prod.content_hash = content_hash(prod, shop_names)
+    return prod, shop_names
+
+
+def content_hash(prod, shop_names):
+    """
+    Return the hash of the data recorded for a product
+    (fields and stores), to detect its changes.
+    """
+    content = [getattr(prod, field) for field in PRODUCT_FIELDS]
+    content.append(sorted(shop_names))
+    return hashlib.sha1(
+        json.dumps(content, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def import_products(items, categ, report=None):
+    """
+    Record a batch of products issued from Open Food Facts (list of dict),
+    linked to the category 'categ', with their stores.
+    The products already recorded (same code) are updated, only if they
+    have changed. If given, the ImportReport 'report' is updated.
+    Return the number of products recorded.
+    """
+    if report is None:
+        report = ImportReport()
+    # normalize the batch in memory (the last occurrence of a code wins)
+    batch = {}
+    for item in items:
+        normalized = normalize_item(item)
+        if normalized is not None:
+            batch[normalized[0].code] = normalized
+    if not batch:
+        return 0
+    with transaction.atomic():
+        # products: insert the new ones, update the changed ones
+        existing = {
+            values[0]: values[1:]
+            for values in Product.objects.filter(code__in=batch).values_list(
+                'code', 'id', 'content_hash', *PRODUCT_FIELDS
+            )
+        }
+        new_prods = []
+        old_prods = []
+        changed_fields = set()
+        for code, (prod, shop_names) in batch.items():
+            if code not in existing:
+                new_prods.append(prod)
+                continue
+            prod.id, old_hash, *old_values = existing[code]
+            if prod.content_hash == old_hash:
+                # not counted twice if the product has several categories
+                if code not in report.codes:
+                    report.skipped += 1
+                continue
+            old_prods.append(prod)
+            changed_fields.update(
+                field for field, old_value in zip(PRODUCT_FIELDS, old_values)
+                if getattr(prod, field) != old_value
+            )
+        Product.objects.bulk_create(new_prods, ignore_conflicts=True)
+        Product.objects.bulk_update(
+            old_prods,
+            sorted(changed_fields) + ['content_hash', 'last_modified_t']
+        )
+        report.inserted += len(new_prods)
+        report.updated += len(old_prods)
+        report.codes.update(batch)
+        prods_id = dict(
+            Product.objects.filter(code__in=batch).values_list('code', 'id')
+        )
+        # stores of the new and changed products only
+        changed = {prod.code for prod in new_prods + old_prods}
+        shop_names = list(dict.fromkeys(
+            name for code, (prod, names) in batch.items() if code in changed
+            for name in names
+        ))
+        Store.objects.bulk_create(
+            [Store(name=name) for name in shop_names],
+            ignore_conflicts=True
+        )
+        shops_id = dict(
+            Store.objects.filter(name__in=shop_names).values_list('name', 'id')
+        )
+        # links between products and categories / stores
+        ProductCategory = Product.categories.through
+        ProductCategory.objects.bulk_create(
+            [
+                ProductCategory(
+                    product_id=prods_id[code], category_id=categ.id
+                )
+                for code in batch
+            ],
+            ignore_conflicts=True
+        )
+        ProductStore = Product.stores.through
+        if old_prods:
+            # the stores of the changed products are replaced
+            ProductStore.objects.filter(
+                product_id__in=[prod.id for prod in old_prods]
+            ).delete()
+        ProductStore.objects.bulk_create(
+            [
+                ProductStore(
+                    product_id=prods_id[code], store_id=shops_id[name]
+                )
+                for code, (prod, names) in batch.items() if code in changed
+                for name in names
+            ],
+            ignore_conflicts=True
+        )
+    return len(batch)
+
+
+def delete_missing_products(report):
+    """
+    Delete the products which have not been seen during a full import
+    (i.e. which disappeared from Open Food Facts), and update 'report'.
+    The substitutes are not computed again for each deleted product:
+    the caller builds them afterwards.
+    """
+    missing = [
+        prod_id
+        for prod_id, code in Product.objects.values_list('id', 'code')
+        if code not in report.codes
+    ]
+    with ProductSubstitute.without_rebuild():
+        for start in range(0, len(missing), DELETE_BATCH_SIZE):
+            Product.objects.filter(
+                id__in=missing[start:start + DELETE_BATCH_SIZE]
+            ).delete()
+    report.deleted += len(missing)
+    return len(missing)
+
+
+def iter_dump_items(path):
+    """
+    Generator: yield the products (dict, as issued from the API) of an
+    Open Food Facts data export, read line by line (constant memory).
+    The export is either a JSONL file or a CSV file (tab-separated),
+    optionally compressed with gzip ('.gz').
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", newline="") as dump:
+        if ".csv" in path or ".tsv" in path:
+            # some fields of the exports are very long
+            csv.field_size_limit(sys.maxsize)
+            for row in csv.DictReader(dump, delimiter="\t"):
+                yield item_from_csv_row(row)
+        else:
+            for line in dump:
+                try:
+                    yield json.loads(line)
+                except ValueError:  # empty or truncated line
+                    continue
+
+
+def item_from_csv_row(row):
+    """
+    Convert a row of an Open Food Facts CSV export
+    into a product, as issued from the API (dict).
+    """
+    item = {key: value for key, value in row.items() if value}
+    # the nutriments are given per 100g
+    item["nutriments"] = {}
+    for name in CSV_NUTRIMENTS:
+        value = row.get(f"{name}_100g")
+        if value:
+            item["nutriments"][f"{name}_value"] = value
+            item["nutriments"][f"{name}_unit"] = "g"
+    return item
+
+
+def _simplify(text):
+    """
+    Return the text in lower case, without accents.
+    """
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def match_categories(item, categories):
+    """
+    Return the categories (among 'categories') of a product issued from
+    an Open Food Facts export, based on its canonical categories tags
+    (e.g. "en:cheeses", see 'Category.OFF_TAGS') or its categories names
+    (e.g. "Fromages").
+    """
+    names = {
+        _simplify(name) for name in item.get("categories", "").split(",")
+    }
+    tags = item.get("categories_tags", [])
+    if isinstance(tags, str):  # CSV export
+        tags = tags.split(",")
+    tags = {tag.strip() for tag in tags}
+    return [
+        categ for categ in categories
+        if Category.OFF_TAGS.get(categ.name) in tags
+        or _simplify(categ.name) in names
+    ]
+
+
+def extract_nutriments_data(item, prod):
+    """
+    This sub-function extracts some nutriments data from Open Food Facts.
+    """
+    try:
+        prod.fat = str(item["nutriments"]["fat_value"]) + \
+                        max(item["nutriments"]["fat_unit"], "g")
+    except KeyError:
+        prod.fat = "donnée inconnue"
+    try:
+        prod.saturated_fat = str(item["nutriments"]["saturated-fat_value"]) + \
+                        max(item["nutriments"]["saturated-fat_unit"], "g")
+    except KeyError:
+        prod.saturated_fat = "donnée inconnue"
+    try:
+        prod.sugars = str(item["nutriments"]["sugars_value"]) + \
+                        max(item["nutriments"]["sugars_unit"], "g")
+    except KeyError:
+        prod.sugars = "donnée inconnue"
+    try:
+        prod.salt = str(item["nutriments"]["salt_value"]) + \
+                        max(item["nutriments"]["salt_unit"], "g")
+    except KeyError:
+        prod.salt = "donnée inconnue"
+    # the same nutriments, in grams per 100g: from the values per 100g
+    # of Open Food Facts if given (the formatted values may be per serving)
+    set_nutriments_100g(prod)
+    nutriments = item.get("nutriments", {})
+    for name, field in zip(CSV_NUTRIMENTS, NUTRIMENTS_FIELDS):
+        try:
+            value = float(nutriments[f"{name}_100g"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        setattr(prod, f"{field}_100g", value)
+
+
+def set_nutriments_100g(prod):
+    """
+    Set the nutriments of a product in grams per 100g (e.g. 'fat_100g'),
+    from its formatted nutriments (e.g. 'fat').
+    """
+    for field in NUTRIMENTS_FIELDS:
+        setattr(prod, f"{field}_100g", parse_nutrient(getattr(prod, field)))
+
+
+def parse_nutrient(value):
+    """
+    Convert a formatted nutriment (e.g. "3.5g", "200mg" or
+    "donnée inconnue") into grams, or None if unknown.
+    """
+    match = re.fullmatch(
+        r"\s*[<>~]?\s*([0-9]+(?:[.,][0-9]+)?)\s*([a-zµ]*)\s*", value or ""
+    )
+    if match is None:
+        return None
+    number, unit = match.groups()
+    if (unit or 'g') not in UNITS:
+        return None
+    return float(number.replace(",", ".")) * UNITS[unit or 'g']
+
+
+def backfill_nutriments(batch_size=DELETE_BATCH_SIZE):
+    """
+    Set the nutriments in grams per 100g of the products already recorded,
+    from their formatted nutriments. Return the number of products updated.
+    """
+    fields = [f"{field}_100g" for field in NUTRIMENTS_FIELDS]
+    prods = Product.objects.order_by('id').only('id', *NUTRIMENTS_FIELDS)
+    updated = 0
+    batch = []
+    for prod in prods.iterator():
+        old_values = [getattr(prod, field) for field in fields]
+        set_nutriments_100g(prod)
+        if [getattr(prod, field) for field in fields] != old_values:
+            batch.append(prod)
+        if len(batch) >= batch_size:
+            Product.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    Product.objects.bulk_update(batch, fields)
+    return updated + len(batch)
@@ -0,0 +1,39 @@
+"""
+This module contains the database indexes of the app 'off_sub'
+which cannot be declared in the models:
+- a composite index on the links between products and categories,
+  oriented for "products in a category",
+- on PostgreSQL only, the indexes of the name searches ('istartswith'
+  and 'icontains' lookups, which compare 'UPPER(product_name)').
+They are created by the migration 0015 (which requires the extension
+'pg_trgm' on PostgreSQL), and dropped by the command 'benchmark_queries'.
+"""
+
+# (name, vendor or None for all vendors)
+EXTRA_INDEXES = [
+    ('off_sub_product_categ_categ_prod_idx', None),
+    ('off_sub_product_name_prefix_idx', 'postgresql'),
+    ('off_sub_product_name_trgm_idx', 'postgresql'),
+]
+
+
+def get_extra_indexes(connection):
+    """
+    Return the list of the names of the extra indexes
+    which apply to the database of 'connection'.
+    """
+    return [
+        name for name, vendor in EXTRA_INDEXES
+        if vendor in (None, connection.vendor)
+    ]
+
+
+def drop_extra_indexes(connection):
+    """
+    Drop the extra indexes which apply to the database of 'connection'.
+    """
+    with connection.cursor() as cursor:
+        for name in get_extra_indexes(connection):
+            cursor.execute(
+                f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}"
+            )
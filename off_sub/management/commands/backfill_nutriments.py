@@ -0,0 +1,26 @@
+"""
+Please execute this module with "manage.py" to set the nutriments in grams
+per 100g (e.g. 'fat_100g') of the products already recorded, from their
+formatted nutriments (e.g. 'fat'), then to precompute the substitutes again.
+"""
+
+from django.core.management.base import BaseCommand
+
+from off_sub.catalogue_cache import bump_catalogue_version
+from off_sub.importer import backfill_nutriments
+from off_sub.models import ProductSubstitute
+
+
+class Command(BaseCommand):
+    help = 'Set the nutriments per 100g of the products'
+
+    def handle(self, *args, **options):
+        nb_products = backfill_nutriments()
+        if nb_products:
+            # the scoring engine uses the nutriments per 100g
+            ProductSubstitute.build()
+            # invalidate the cached data regarding the catalogue
+            bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Nutriments mis à jour pour {nb_products} produits."
+        ))
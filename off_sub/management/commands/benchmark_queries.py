@@ -0,0 +1,197 @@
+"""
+Please execute this module with "manage.py" to compare the query plans
+and the durations of the hot queries of the catalogue, with and without
+the indexes of the app 'off_sub', on a synthetic catalogue.
+Everything is done in a transaction which is rolled back at the end:
+the database is left unchanged.
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from off_sub.indexes import drop_extra_indexes
+from off_sub.models import Category, Product, ProductSubstitute
+
+# words used to build the names of the synthetic products
+WORDS = [
+    "chocolat", "biscuit", "yaourt", "fromage", "pain", "pizza", "riz",
+    "saumon", "jambon", "tomate", "lait", "beurre", "nature", "bio",
+    "complet", "noisette", "vanille", "fraise", "citron", "poulet",
+]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the hot queries of the catalogue, with/without indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--products',
+            type=int,
+            default=100000,
+            help="Number of synthetic products (default: 100000)",
+        )
+        parser.add_argument(
+            '--categories',
+            type=int,
+            default=20,
+            help="Number of synthetic categories (default: 20)",
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help="Number of executions of each query (default: 5)",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.stdout.write("Création du catalogue synthétique...")
+            categ, prod = create_catalogue(
+                options['products'], options['categories']
+            )
+            # deferred constraints are checked now (PostgreSQL refuses
+            # to drop the indexes of a table with pending checks)
+            connection.check_constraints()
+            queries = get_queries(categ, prod)
+            self.run_queries(queries, options['repeat'], "avec index")
+            drop_indexes()
+            self.run_queries(queries, options['repeat'], "sans index")
+            # leave the database unchanged
+            transaction.set_rollback(True)
+
+    def run_queries(self, queries, repeat, label):
+        """
+        Write the query plan and the best duration of each query.
+        """
+        analyze()
+        self.stdout.write(self.style.WARNING(f"=== {label} ==="))
+        for name, queryset in queries:
+            durations = []
+            for i in range(repeat):
+                start = time.perf_counter()
+                list(queryset.all())  # a new evaluation each time
+                durations.append(time.perf_counter() - start)
+            self.stdout.write(
+                f"{name} : {min(durations) * 1000:.2f} ms\n"
+                f"{queryset.explain()}\n"
+            )
+
+
+# functions called in the method 'Command.handle'
+def create_catalogue(nb_products, nb_categories, seed=0):
+    """
+    Record a synthetic catalogue, and return a category
+    and a product of the catalogue.
+    """
+    rand = random.Random(seed)
+    Category.objects.bulk_create([
+        Category(name=f"benchmark-{i}") for i in range(nb_categories)
+    ])
+    # the id are not set by 'bulk_create' on every database backend
+    categories = list(Category.objects.filter(
+        name__startswith="benchmark-"
+    ).values_list('id', flat=True))
+    first_code = 10 ** 12
+    Product.objects.bulk_create(
+        (
+            Product(
+                code=str(first_code + i),
+                product_name=" ".join(rand.sample(WORDS, 3)) + f" {i}",
+                nutriscore_grade=rand.choice("abcde"),
+                nutriscore_score=rand.randint(-15, 40),
+                url="",
+            )
+            for i in range(nb_products)
+        ),
+        batch_size=batch_size(Product, 1000)
+    )
+    prods_id = Product.objects.filter(
+        code__gte=str(first_code)
+    ).values_list('id', flat=True)
+    ProductCategory = Product.categories.through
+    ProductCategory.objects.bulk_create(
+        (
+            ProductCategory(product_id=prod_id, category_id=categ_id)
+            for prod_id in prods_id.iterator()
+            for categ_id in rand.sample(categories, 2)
+        ),
+        batch_size=batch_size(ProductCategory, 1000)
+    )
+    categ = Category.objects.get(id=categories[0])
+    prod = categ.products.order_by('id').first()
+    # precomputed substitutes of the product (read by 'get_best_subs')
+    ProductSubstitute.rebuild([], [prod.id])
+    return categ, prod
+
+
+def batch_size(model, size):
+    """
+    Return the batch size of 'bulk_create', within the limits
+    of the database backend (as 'bulk_update').
+    """
+    fields = [field.column for field in model._meta.concrete_fields]
+    return max(min(size, connection.ops.bulk_batch_size(
+        fields, [None] * size
+    )), 1)
+
+
+def get_queries(categ, prod):
+    """
+    Return the list of the hot queries (name, queryset), as run
+    by the views (e.g. the two paths of 'Product.get_best_subs').
+    """
+    return [
+        (
+            "substituts (précalculés)",
+            Product.objects.filter(substitute_for__product=prod)
+            .order_by('substitute_for__rank')[:6],
+        ),
+        (
+            "substituts (sans précalcul, repli)",
+            Product.objects.filter(categories__products=prod).distinct()
+            .order_by('nutriscore_score', 'id')[:6],
+        ),
+        (
+            "produits d'une catégorie par score",
+            Product.objects.filter(categories=categ)
+            .order_by('nutriscore_score', 'id')[:12],
+        ),
+        (
+            "produits par nutriscore",
+            Product.objects.filter(nutriscore_grade='a').order_by('id')[:12],
+        ),
+        (
+            "suggestions (préfixe)",
+            Product.objects.filter(product_name__istartswith="choc")
+            .order_by('product_name')[:10],
+        ),
+        (
+            "suggestions (sous-chaîne)",
+            Product.objects.filter(product_name__icontains="noisette")
+            .order_by('product_name')[:10],
+        ),
+    ]
+
+
+def drop_indexes():
+    """
+    Drop the indexes of the products (declared in the model,
+    and extra ones), in the current transaction.
+    """
+    with connection.cursor() as cursor:
+        for index in Product._meta.indexes:
+            cursor.execute(
+                f"DROP INDEX {connection.ops.quote_name(index.name)}"
+            )
+    drop_extra_indexes(connection)
+
+
+def analyze():
+    """
+    Update the statistics used by the query planner.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
@@ -0,0 +1,44 @@
+"""
+Please execute this module with "manage.py", after the database has been
+filled in (command 'db_init'), to precompute the best substitutes
+of each product.
+"""
+
+from django.core.management.base import BaseCommand
+
+from off_sub.catalogue_cache import bump_catalogue_version
+from off_sub.models import Category, ProductSubstitute
+
+
+class Command(BaseCommand):
+    help = 'Precompute the best substitutes of the products'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--categories',
+            nargs='+',
+            metavar='NAME',
+            help="Only process the products of these categories",
+        )
+        parser.add_argument(
+            '--popularity',
+            action='store_true',
+            help="Rank the most saved products first among equivalent "
+            "substitutes (default: setting SUBSTITUTES_POPULARITY)",
+        )
+
+    def handle(self, *args, **options):
+        if options['categories']:
+            categories = Category.objects.filter(
+                name__in=options['categories']
+            )
+        else:
+            categories = None
+        nb_products = ProductSubstitute.build(
+            categories, popularity=options['popularity'] or None
+        )
+        # invalidate the cached data regarding the catalogue
+        bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Substituts calculés pour {nb_products} produits."
+        ))
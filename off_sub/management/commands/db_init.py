@@ -4,114 +4,260 @@ to build and fill in the database 'pur_beurre_db'.
 Pre-requisite: the database 'pur_beurre_db' has to be created.
 """
 
-import re
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from django.core.management.base import BaseCommand
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-from off_sub.models import Category, Product, Store
+from off_sub.catalogue_cache import bump_catalogue_version
+from off_sub.importer import ImportReport, delete_missing_products, \
+    import_products, iter_dump_items, match_categories
+from off_sub.models import Category, ProductSubstitute
 
 
 class Command(BaseCommand):
     help = 'Initialize the database'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help="Number of categories fetched concurrently (default: 4)",
+        )
+        parser.add_argument(
+            '--retries',
+            type=int,
+            default=3,
+            help="Number of retries of a failed HTTP request (default: 3)",
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=250,
+            help="Number of products per page of results (default: 250)",
+        )
+        parser.add_argument(
+            '--max-products',
+            type=int,
+            default=None,
+            help="Maximum number of products per category (default: all)",
+        )
+        parser.add_argument(
+            '--from-dump',
+            default=None,
+            metavar='PATH',
+            help="Import the products from an Open Food Facts export "
+                 "(JSONL or CSV, optionally gzipped) instead of the API",
+        )
+        parser.add_argument(
+            '--sync',
+            action='store_true',
+            help="Also delete the products which disappeared from "
+                 "Open Food Facts (full imports only)",
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.WARNING(
             "Installation en cours, veuillez patienter SVP..."
         ))
-        # fill in the database tables with products, categories and stores
-        # iterate on each pre-selected category
+        # initialize the pre-selected categories
+        categories = []
         for categ_name in Category.get_categories_list():
-            # initialize the category
             categ = Category.objects.get_or_create(name=categ_name)[0]
             # add the category to the database
             categ.add_category_to_db()
-            # execute the HTTP request to get products with API
-            categ_250 = requests.get(categ.get_url_250_products())
-            categ_250_dict = categ_250.json()
-            if (categ_250.status_code == 200) and (categ_250_dict["count"]):
-                api_return = categ_250.json()  # type is dict
-                products_list = api_return["products"]  # type is list of dict
-                # iterate on each product
-                for item in products_list:  # type is dict
-                    # initiate a new instance of product
-                    prod = Product()
-                    # filter on:
-                    # - products containing "France" in the list of countries
-                    # - products with 'nutrition_grade_fr' and 'code' completed
-                    regexp = "(.*)[Ff]rance(.*)"
-                    if (re.match(regexp, item["countries"]) is not None) \
-                            and ("code" in item.keys()) \
-                            and ("nutriscore_grade" in item.keys()):
-                        # set the product attributes
-                        prod.code = item["code"]
-                        try:
-                            prod.product_name = item["product_name"]
-                        except KeyError:
-                            prod.product_name = "[Produit sans nom]"
-                        prod.nutriscore_grade = item["nutriscore_grade"]
-                        prod.nutriscore_score = \
-                            int(item["nutriscore_score"])
-                        try:
-                            prod.url = item["url"]
-                        except KeyError:
-                            prod.url = ""
-                        try:
-                            prod.image_url = item["image_url"]
-                        except KeyError:
-                            prod.image_url = ""
-                        # extract some nutriments data as fat, sugars and salt
-                        extract_nutriments_data(item, prod)
-                        # add the product to the database, if necessary
-                        prod_id = prod.add_product_to_db()
-                        # cover the case where the product already exists
-                        prod = Product.objects.get(id=prod_id)
-                        # update database (table ProductCategory), if necessary
-                        prod.add_product_category_to_db(categ)
-                        # if applicable, link the stores and the product
-                        shop_names = []
-                        try:
-                            shops_list = item["stores"].split(",")
-                            shop_names = [
-                                shop.strip() for shop in shops_list
-                            ]
-                        except KeyError:  # if no store mentioned here...
-                            # ... then skip this step
-                            continue
-                        for shop_name in shop_names:
-                            # create a new instance of store
-                            shop = Store.objects.get_or_create(
-                                name=shop_name
-                            )[0]
-                            # add the store to the database, if necessary
-                            shop.add_store_to_db()
-                            # update the database (table ProductStore)
-                            prod.add_product_store_to_db(shop)
+            categories.append(categ)
+        self.report = ImportReport()
+        self.failed = False
+        if options['from_dump']:
+            # offline import, from a local export of Open Food Facts
+            self.import_dump(
+                options['from_dump'], categories,
+                options['page_size'], options['max_products']
+            )
+        else:
+            self.import_api(categories, options)
+        if options['sync']:
+            if self.failed or options['max_products'] is not None:
+                self.stderr.write(
+                    "Import partiel : aucun produit n'est supprimé."
+                )
+            else:
+                delete_missing_products(self.report)
+        self.stdout.write(f"Produits : {self.report}")
+        if self.report.changed:
+            # precompute the best substitutes of the imported products
+            ProductSubstitute.build(categories)
+            # invalidate the cached data regarding the catalogue
+            bump_catalogue_version()
         self.stdout.write(self.style.SUCCESS("Installation terminée !"))
 
+    def import_api(self, categories, options):
+        """
+        Import the products of the categories with the API.
+        """
+        # execute the HTTP requests to get products with API, concurrently:
+        # the workers put the pages in a bounded queue (flat memory use)
+        session = get_session(options['workers'], options['retries'])
+        pages = queue.Queue(maxsize=2 * options['workers'])
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for categ in categories:
+                executor.submit(
+                    fetch_category, session, categ, pages, stop,
+                    options['page_size'], options['max_products']
+                )
+            # fill in the database tables with products and stores,
+            # in this thread only, page by page
+            try:
+                self.import_pages(pages, len(categories))
+            finally:
+                stop.set()
+
+    def import_dump(self, path, categories, batch_size, max_products=None):
+        """
+        Import the products of the categories from an Open Food Facts
+        export, read line by line, by batch of 'batch_size' products
+        per category (flat memory use), and report the progress.
+        """
+        batches = {categ.id: [] for categ in categories}
+        nb_products = {categ.id: 0 for categ in categories}
+        for item in iter_dump_items(path):
+            for categ in match_categories(item, categories):
+                if max_products is not None and \
+                        nb_products[categ.id] + len(batches[categ.id]) \
+                        >= max_products:
+                    continue
+                batches[categ.id].append(item)
+                if len(batches[categ.id]) >= batch_size:
+                    nb_products[categ.id] += import_products(
+                        batches[categ.id], categ, self.report
+                    )
+                    batches[categ.id] = []
+        for counter, categ in enumerate(categories, start=1):
+            nb_products[categ.id] += import_products(
+                batches[categ.id], categ, self.report
+            )
+            self.stdout.write(
+                f"[{counter}/{len(categories)}] {categ.name} : "
+                f"{nb_products[categ.id]} produits"
+            )
+
+    def import_pages(self, pages, nb_categories):
+        """
+        Record the pages of products put in the queue 'pages',
+        until all categories are fetched, and report the progress.
+        """
+        counter = 0
+        nb_products = {}
+        while counter < nb_categories:
+            categ, page = pages.get()
+            if page is None:  # end of the category
+                counter += 1
+                self.stdout.write(
+                    f"[{counter}/{nb_categories}] {categ.name} : "
+                    f"{nb_products.get(categ.name, 0)} produits"
+                )
+            elif isinstance(page, Exception):
+                self.failed = True
+                self.stderr.write(
+                    f"{categ.name} : échec du téléchargement ({page})"
+                )
+            else:
+                nb_products[categ.name] = \
+                    nb_products.get(categ.name, 0) \
+                    + import_products(page, categ, self.report)
 
-# function called in the method 'Command.handle'
-def extract_nutriments_data(item, prod):
+
+# functions called in the method 'Command.handle'
+def get_session(workers, retries):
     """
-    This sub-function extracts some nutriments data from Open Food Facts.
+    Return a HTTP session, shared by the workers (connection reuse),
+    which retries the failed requests with an exponential backoff.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+    )
+    adapter = HTTPAdapter(
+        max_retries=retry,
+        pool_connections=workers,
+        pool_maxsize=workers,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def fetch_products(session, url):
+    """
+    Execute the HTTP request to get products with API, and return
+    the list of products (list of dict) and the total number of products.
+    """
+    response = session.get(url, timeout=60)
+    api_return = response.json()  # type is dict
+    if (response.status_code == 200) and (api_return["count"]):
+        # type is list of dict
+        return api_return["products"], int(api_return["count"])
+    return [], 0
+
+
+def iter_category_pages(session, categ, page_size, max_products=None):
+    """
+    Generator: yield the products of a category (list of dict),
+    page by page, until all of them (or 'max_products') are fetched.
+    """
+    fetched = 0
+    page = 1
+    while max_products is None or fetched < max_products:
+        products_list, count = fetch_products(
+            session, categ.get_url_products(page, page_size)
+        )
+        if max_products is not None:
+            products_list = products_list[:max_products - fetched]
+        if not products_list:
+            break
+        yield products_list
+        fetched += len(products_list)
+        # stop after the last page
+        if (fetched >= count) or (len(products_list) < page_size):
+            break
+        page += 1
+
+
+def fetch_category(session, categ, pages, stop, page_size, max_products):
+    """
+    Fetch the products of a category, and put the pages in the queue
+    'pages', followed by None (or by the error, if any).
+    This function is executed by the workers.
     """
     try:
-        prod.fat = str(item["nutriments"]["fat_value"]) + \
-                        max(item["nutriments"]["fat_unit"], "g")
-    except KeyError:
-        prod.fat = "donnée inconnue"
-    try:
-        prod.saturated_fat = str(item["nutriments"]["saturated-fat_value"]) + \
-                        max(item["nutriments"]["saturated-fat_unit"], "g")
-    except KeyError:
-        prod.saturated_fat = "donnée inconnue"
-    try:
-        prod.sugars = str(item["nutriments"]["sugars_value"]) + \
-                        max(item["nutriments"]["sugars_unit"], "g")
-    except KeyError:
-        prod.sugars = "donnée inconnue"
-    try:
-        prod.salt = str(item["nutriments"]["salt_value"]) + \
-                        max(item["nutriments"]["salt_unit"], "g")
-    except KeyError:
-        prod.salt = "donnée inconnue"
+        for products_list in iter_category_pages(
+            session, categ, page_size, max_products
+        ):
+            if not put_page(pages, stop, (categ, products_list)):
+                return
+    except Exception as error:  # reported by the main thread
+        put_page(pages, stop, (categ, error))
+    put_page(pages, stop, (categ, None))
+
+
+def put_page(pages, stop, page):
+    """
+    Put a page in the queue 'pages', waiting for a free slot,
+    unless the import is stopped. Return False if it is stopped.
+    """
+    while not stop.is_set():
+        try:
+            pages.put(page, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
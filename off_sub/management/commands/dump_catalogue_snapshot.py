@@ -0,0 +1,27 @@
+"""
+Please execute this module with "manage.py" to write a snapshot of the
+catalogue (categories, stores and products), which can be loaded again
+with the command 'load_catalogue_snapshot'.
+"""
+
+from django.core.management.base import BaseCommand
+
+from off_sub.snapshot import dump_catalogue, open_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write a snapshot of the catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="Snapshot file (JSON Lines), compressed with gzip "
+                 "if its name ends with '.gz' (e.g. catalogue.jsonl.gz)",
+        )
+
+    def handle(self, *args, **options):
+        with open_snapshot(options['path'], "w") as stream:
+            nb_records = dump_catalogue(stream)
+        self.stdout.write(self.style.SUCCESS(
+            f"Instantané écrit : {nb_records} enregistrements."
+        ))
@@ -0,0 +1,41 @@
+"""
+Please execute this module with "manage.py" to fill in the database with
+a snapshot of the catalogue (command 'dump_catalogue_snapshot'), or with
+a Django fixture of the catalogue (e.g. "off_sub/dumps/off_sub.json").
+It is much faster than the command 'loaddata'.
+"""
+
+from django.core.management.base import BaseCommand
+
+from off_sub.catalogue_cache import bump_catalogue_version
+from off_sub.models import ProductSubstitute
+from off_sub.snapshot import iter_fixture, iter_snapshot, load_catalogue, \
+    open_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Load a snapshot of the catalogue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help="Snapshot file (.jsonl), or Django fixture (.json), "
+                 "optionally compressed with gzip (.gz)",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        with open_snapshot(path, "r") as stream:
+            if path.endswith((".json", ".json.gz")):
+                records = iter_fixture(stream)
+            else:
+                records = iter_snapshot(stream)
+            counters = load_catalogue(records)
+        # precompute the best substitutes of the loaded products
+        ProductSubstitute.build()
+        # invalidate the cached data regarding the catalogue
+        bump_catalogue_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Instantané chargé : {counters['category']} catégories, "
+            f"{counters['store']} magasins, {counters['product']} produits."
+        ))
@@ -0,0 +1,27 @@
+# Generated by Django 3.0.7 on 2026-10-17 20:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0011_auto_20200321_0726'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSubstitute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score_delta', models.IntegerField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitutes', to='off_sub.Product')),
+                ('substitute', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='substitute_for', to='off_sub.Product')),
+            ],
+            options={
+                'unique_together': {('product', 'rank')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.7 on 2026-10-17 20:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0012_productsubstitute'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=40),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_modified_t',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 3.0.7 on 2026-10-17 20:54
+
+import re
+
+from django.db import migrations, models
+
+NUTRIMENTS_FIELDS = ['fat', 'saturated_fat', 'sugars', 'salt']
+UNITS = {'g': 1, 'mg': 1e-3, 'µg': 1e-6, 'mcg': 1e-6}
+
+
+def parse_nutrient(value):
+    # formatted nutriment (e.g. "3.5g", "200mg") into grams, or None
+    match = re.fullmatch(
+        r"\s*[<>~]?\s*([0-9]+(?:[.,][0-9]+)?)\s*([a-zµ]*)\s*", value or ""
+    )
+    if match is None:
+        return None
+    number, unit = match.groups()
+    if (unit or 'g') not in UNITS:
+        return None
+    return float(number.replace(",", ".")) * UNITS[unit or 'g']
+
+
+def backfill_nutriments(apps, schema_editor):
+    # the mg (and µg) values are converted into grams
+    Product = apps.get_model('off_sub', 'Product')
+    fields = [f"{field}_100g" for field in NUTRIMENTS_FIELDS]
+    batch = []
+    for prod in Product.objects.order_by('id').iterator():
+        for field in NUTRIMENTS_FIELDS:
+            setattr(
+                prod, f"{field}_100g", parse_nutrient(getattr(prod, field))
+            )
+        batch.append(prod)
+        if len(batch) >= 500:
+            Product.objects.bulk_update(batch, fields)
+            batch = []
+    Product.objects.bulk_update(batch, fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0013_product_change_detection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='fat_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='salt_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='saturated_fat_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='sugars_100g',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_nutriments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 3.0.7 on 2026-10-17 20:55
+
+from django.db import migrations, models
+
+
+# (name, vendor or None for all vendors, SQL query)
+EXTRA_INDEXES = [
+    (
+        'off_sub_product_categ_categ_prod_idx',
+        None,
+        'CREATE INDEX {name} ON off_sub_product_categories '
+        '(category_id, product_id)',
+    ),
+    (
+        'off_sub_product_name_prefix_idx',
+        'postgresql',
+        'CREATE INDEX {name} ON off_sub_product '
+        '(UPPER(product_name::text) varchar_pattern_ops)',
+    ),
+    (
+        'off_sub_product_name_trgm_idx',
+        'postgresql',
+        'CREATE INDEX {name} ON off_sub_product '
+        'USING gin (UPPER(product_name::text) gin_trgm_ops)',
+    ),
+]
+
+
+def create_extra_indexes(apps, schema_editor):
+    # vendor-specific indexes (e.g. name search on PostgreSQL)
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, vendor, sql in EXTRA_INDEXES:
+        if vendor in (None, connection.vendor):
+            schema_editor.execute(
+                sql.format(name=schema_editor.quote_name(name))
+            )
+
+
+def drop_extra_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    for name, vendor, sql in EXTRA_INDEXES:
+        if vendor in (None, connection.vendor):
+            schema_editor.execute(
+                f"DROP INDEX IF EXISTS {schema_editor.quote_name(name)}"
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0014_product_nutriments_100g'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['nutriscore_score', 'id'], name='product_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['nutriscore_grade'], name='product_grade_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['product_name'], name='product_name_idx'),
+        ),
+        migrations.RunPython(create_extra_indexes, drop_extra_indexes),
+    ]
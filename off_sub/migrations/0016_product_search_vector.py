@@ -0,0 +1,67 @@
+# Generated by Django 3.0.7 on 2026-10-17 20:58
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# database objects maintaining the search vectors (PostgreSQL only)
+SEARCH_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    """
+    CREATE OR REPLACE FUNCTION off_sub_product_search_vector_update()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector(
+                'french', unaccent(coalesce(NEW.product_name, ''))
+            ), 'A')
+            || setweight(to_tsvector('simple', coalesce(NEW.code, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER off_sub_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF product_name, code ON off_sub_product
+    FOR EACH ROW EXECUTE PROCEDURE off_sub_product_search_vector_update()
+    """,
+    # search vectors of the products already recorded
+    "UPDATE off_sub_product SET product_name = product_name",
+    "CREATE INDEX off_sub_product_search_idx ON off_sub_product "
+    "USING gin (search_vector)",
+]
+DROP_SEARCH_SQL = [
+    "DROP INDEX IF EXISTS off_sub_product_search_idx",
+    "DROP TRIGGER IF EXISTS off_sub_product_search_vector_trigger "
+    "ON off_sub_product",
+    "DROP FUNCTION IF EXISTS off_sub_product_search_vector_update()",
+]
+
+
+def create_search_objects(apps, schema_editor):
+    # trigger and GIN index of the search vectors, on PostgreSQL only
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in SEARCH_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_search_objects(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in DROP_SEARCH_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0015_product_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_objects, drop_search_objects),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.7 on 2026-10-17 21:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def set_favorites_counts(apps, schema_editor):
+    # the counters of the products from the existing favorites
+    Product = apps.get_model('off_sub', 'Product')
+    Favorite = apps.get_model('my_auth', 'Favorite')
+    counts = Favorite.objects.filter(
+        product=OuterRef('pk')
+    ).values('product').annotate(count=Count('id')).values('count')
+    Product.objects.update(favorites_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('off_sub', '0016_product_search_vector'),
+        ('my_auth', '0005_favorite'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-favorites_count', 'id'], name='product_favorites_idx'),
+        ),
+        migrations.RunPython(set_favorites_counts, migrations.RunPython.noop),
+    ]
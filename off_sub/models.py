@@ -1,8 +1,18 @@
-from django.db import models
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connection, models
 from django.db.utils import IntegrityError
 from django.db import transaction
 
 
+# state of the rebuilds of the substitutes (per thread), see
+# 'ProductSubstitute.without_rebuild'
+_rebuild_state = threading.local()
+
+
 class Category(models.Model):
     name = models.CharField(max_length=200, unique=True)
 
@@ -17,6 +27,19 @@ class Category(models.Model):
         "riz",
         "viandes",
     ]
+    # canonical tags of the categories in Open Food Facts (field
+    # 'categories_tags' of the products, in English)
+    OFF_TAGS = {
+        "desserts": "en:desserts",
+        "eaux": "en:waters",
+        "fromages": "en:cheeses",
+        "legumes": "en:vegetables",
+        "pains": "en:breads",
+        "pizzas": "en:pizzas",
+        "poissons": "en:fishes",
+        "riz": "en:rices",
+        "viandes": "en:meats",
+    }
 
     def add_category_to_db(self):
         """
@@ -39,14 +62,24 @@ class Category(models.Model):
 
     def get_url_250_products(self):
         """
-        Supply the search url, which displays 1000 products,
+        Supply the search url, which displays 250 products,
+        based on the category name.
+        """
+        return self.get_url_products(page=1, page_size=250)
+
+    def get_url_products(self, page=1, page_size=250):
+        """
+        Supply the search url, which displays the page 'page'
+        of the products ('page_size' products per page),
         based on the category name.
         """
         if self.name in self.CATEGORIES_LIST:
             res = "https://fr.openfoodfacts.org/cgi/search.pl?" \
                 + "action=process&tagtype_0=categories" \
                 + "&tag_contains_0=contains&tag_0=" \
-                + self.name + "&page_size=250&json=1"
+                + self.name + f"&page_size={page_size}&json=1"
+            if page > 1:
+                res += f"&page={page}"
         else:
             res = ""
         return res
@@ -78,13 +111,52 @@ class Product(models.Model):
     saturated_fat = models.CharField(max_length=100, null=True)
     sugars = models.CharField(max_length=100, null=True)
     salt = models.CharField(max_length=100, null=True)
+    # nutrients in grams per 100g, or None if unknown
+    # (set from the formatted strings above by 'off_sub.importer')
+    fat_100g = models.FloatField(null=True, blank=True)
+    saturated_fat_100g = models.FloatField(null=True, blank=True)
+    sugars_100g = models.FloatField(null=True, blank=True)
+    salt_100g = models.FloatField(null=True, blank=True)
     url = models.CharField(max_length=1000)
     image_url = models.CharField(max_length=1000, null=True)
+    # change detection for the incremental imports (see 'off_sub.importer')
+    content_hash = models.CharField(max_length=40, blank=True, default="")
+    last_modified_t = models.BigIntegerField(null=True, blank=True)
+    # full-text search, maintained by the database (see 'off_sub.search')
+    search_vector = SearchVectorField(null=True, editable=False)
+    # number of users who saved the product (maintained by the favorites,
+    # see 'auth.models.Favorite', and by the command
+    # 'reconcile_favorites_counts' of the app 'auth')
+    favorites_count = models.PositiveIntegerField(default=0, editable=False)
     # create association table off_sub_product_categories in database
     categories = models.ManyToManyField(Category, related_name='products')
     # create association table off_sub_product_stores in database
     stores = models.ManyToManyField(Store, related_name='products', blank=True)
 
+    class Meta:
+        indexes = [
+            # best products first ('get_best_subs')
+            models.Index(
+                fields=['nutriscore_score', 'id'], name='product_score_idx'
+            ),
+            models.Index(
+                fields=['nutriscore_grade'], name='product_grade_idx'
+            ),
+            # suggestions sorted by name ('get_suggestions'); see also
+            # the name search indexes of PostgreSQL (module 'indexes')
+            models.Index(fields=['product_name'], name='product_name_idx'),
+            # most saved products first ('get_most_saved')
+            models.Index(
+                fields=['-favorites_count', 'id'],
+                name='product_favorites_idx'
+            ),
+        ]
+
+    # number of suggestions returned by the autocompletion, by default...
+    SUGGESTIONS_LIMIT = 10
+    # ... and at most
+    SUGGESTIONS_MAX = 50
+
     def __str__(self):
         # return f"{self.code} - {self.product_name}".replace("'", r"\'")
         return f"{self.product_name} [code-barres : {self.code}]"
@@ -122,18 +194,252 @@ class Product(models.Model):
         If the selected product is among the best products,
         it will be also returned to show that this is a "good" product.
         """
-        # get the product category/ies linked to the product
-        prod_categories = [categ for categ in self.categories.all()]
-        # list all the products in database for the product category/ies
-        prods_id = []
-        for categ in prod_categories:
-            for prod in Product.objects.filter(categories=categ):
-                prods_id += [prod.id]
-        # remove duplicates
-        prods_id = list(set(prods_id))
-        # get back to the Product Queryset
-        prods_qs = Product.objects.filter(id__in=prods_id)
+        # if available, read the precomputed substitutes
+        if nb_sub <= ProductSubstitute.NB_SUBSTITUTES:
+            subs_qs = Product.objects.filter(
+                substitute_for__product=self
+            ).order_by('substitute_for__rank')[:nb_sub]
+            if subs_qs:  # evaluate the queryset (one query)
+                return subs_qs
+        # otherwise (not built yet), compute them:
+        # products sharing (at least) one category with the product,
+        # in a single query (join through off_sub_product_categories)
+        prods_qs = Product.objects.filter(
+            categories__products=self
+        ).distinct()
         # sort the products based on the nutriscore
-        prods_qs = prods_qs.order_by('nutriscore_score')
+        prods_qs = prods_qs.order_by('nutriscore_score', 'id')
         # get the 'nb_sub' best subs
         return prods_qs[:nb_sub]
+
+    @classmethod
+    def get_most_saved(cls, nb_prod, grades=('a', 'b')):
+        """
+        Return a queryset with (at most) 'nb_prod' of the products most
+        saved by the users as favorites, among the given nutriscore grades
+        (by default, the healthy products), from the counters of favorites.
+        """
+        return cls.objects.filter(
+            favorites_count__gt=0, nutriscore_grade__in=grades
+        ).order_by('-favorites_count', 'nutriscore_score', 'id')[:nb_prod]
+
+    @classmethod
+    def get_suggestions(cls, term, nb_sugg):
+        """
+        Return a list of (at most) 'nb_sugg' strings describing the products
+        matching the term typed by the user, for autocompletion.
+        Products whose name (or code) starts with the term come first,
+        then products whose name contains the term.
+        """
+        term = term.strip()
+        if not term:
+            return []
+        # only the fields displayed by '__str__' are needed
+        prods = cls.objects.only('code', 'product_name')
+        # prefix search (may use an index)
+        if term.isdigit():
+            prefix_qs = prods.filter(code__startswith=term)
+        else:
+            prefix_qs = prods.filter(product_name__istartswith=term)
+        matches = list(prefix_qs.order_by('product_name')[:nb_sugg])
+        # if necessary, complete with a substring search
+        if len(matches) < nb_sugg and len(term) >= 3:
+            substring_qs = prods.filter(
+                product_name__icontains=term
+            ).exclude(
+                id__in=[prod.id for prod in matches]
+            )
+            matches += list(
+                substring_qs.order_by('product_name')[:nb_sugg - len(matches)]
+            )
+        return [str(prod) for prod in matches]
+
+
+class ProductSubstitute(models.Model):
+    """
+    A precomputed substitute of a product, with its rank
+    (the table is built by the command 'build_substitutes').
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='substitutes'
+    )
+    substitute = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='substitute_for'
+    )
+    rank = models.PositiveSmallIntegerField()
+    # substitute's nutriscore score minus product's nutriscore score
+    score_delta = models.IntegerField()
+
+    # number of precomputed substitutes per product
+    NB_SUBSTITUTES = 12
+
+    class Meta:
+        # also create the index used to read the substitutes of a product
+        unique_together = [('product', 'rank')]
+
+    @classmethod
+    def build(cls, categories=None, batch_size=1000, popularity=None):
+        """
+        Compute, with the scoring engine (module 'scoring'), and record
+        the best substitutes of the products of the given categories
+        (of all products if 'categories' is None).
+        If 'popularity' (by default, the setting 'SUBSTITUTES_POPULARITY'),
+        the most saved products come first among the substitutes with
+        the same score.
+        Return the number of products processed.
+        """
+        # the scoring engine uses the models of this module
+        from .scoring import Catalogue
+        catalogue, categs_id = Catalogue.load()
+        # select the products to process
+        if categories is None:
+            selected = catalogue.nb_categories > 0
+        else:
+            columns = [
+                categs_id.index(categ.id) for categ in categories
+                if categ.id in categs_id
+            ]
+            selected = catalogue.categories[:, columns].any(axis=1)
+        rows = selected.nonzero()[0]
+        with transaction.atomic():
+            if categories is None:
+                cls.objects.all().delete()
+            else:
+                cls.invalidate([categs_id[col] for col in columns])
+            cls._record(catalogue, rows, batch_size, popularity)
+        return len(rows)
+
+    @classmethod
+    def rebuild(cls, categories_id, products_id=(), batch_size=1000,
+                popularity=None):
+        """
+        Compute again the substitutes of the products of the given
+        categories and of the given products (e.g. removed from these
+        categories), with the scoring engine loaded for the products
+        sharing a category with them only (see 'build').
+        Return the number of products processed.
+        """
+        # the scoring engine uses the models of this module
+        from .scoring import Catalogue
+        products = Product.objects.filter(
+            models.Q(categories__in=categories_id)
+            | models.Q(id__in=products_id)
+        ).values('id')
+        links = Product.categories.through.objects
+        catalogue, categs_id = Catalogue.load(
+            links.filter(product__in=products).values('category_id')
+        )
+        rows = catalogue.rows_of(products.values_list('id', flat=True))
+        with transaction.atomic():
+            cls.objects.filter(product__in=products).delete()
+            cls._record(catalogue, rows, batch_size, popularity)
+        return len(rows)
+
+    @classmethod
+    def _record(cls, catalogue, rows, batch_size, popularity):
+        """
+        Rank, with the scoring engine, and record the substitutes
+        of the products in 'rows' of the catalogue (see 'build').
+        """
+        from .scoring import rank_substitutes
+        if popularity is None:
+            popularity = getattr(settings, 'SUBSTITUTES_POPULARITY', False)
+        # respect the limits of the database backend (as 'bulk_update')
+        max_batch_size = connection.ops.bulk_batch_size(
+            ['product_id', 'substitute_id', 'rank', 'score_delta'],
+            [None] * batch_size
+        )
+        batch_size = min(batch_size, max(max_batch_size, 1))
+        records = []
+        for row, subs_rows in rank_substitutes(
+            catalogue, rows, cls.NB_SUBSTITUTES, popularity=popularity
+        ):
+            prod_score = int(catalogue.nutriscores[row])
+            records += [
+                cls(
+                    product_id=int(catalogue.ids[row]),
+                    substitute_id=int(catalogue.ids[sub_row]),
+                    rank=rank,
+                    score_delta=int(catalogue.nutriscores[sub_row])
+                    - prod_score,
+                )
+                for rank, sub_row in enumerate(subs_rows)
+            ]
+            # record the substitutes by batch, to bound memory use
+            if len(records) >= batch_size:
+                cls.objects.bulk_create(records, batch_size=batch_size)
+                records = []
+        cls.objects.bulk_create(records, batch_size=batch_size)
+
+    @classmethod
+    def build_on_commit(cls, categories_id=(), products_id=()):
+        """
+        When the current transaction is committed (e.g. after a product
+        changed), compute again the substitutes of the products of the given
+        categories (and of the given products, e.g. removed from these
+        categories), then update the catalogue version, so that the data
+        cached for the new version are built from the committed catalogue;
+        the outdated substitutes are kept until then.
+        The calls during a transaction are coalesced into one rebuild, and
+        only update the catalogue version within 'without_rebuild'.
+        """
+        if getattr(_rebuild_state, 'disabled', 0):
+            categories_id = products_id = ()
+        for entry in connection.run_on_commit:
+            if isinstance(entry[1], PendingRebuild):
+                entry[1].add(categories_id, products_id)
+                return
+        pending = PendingRebuild()
+        pending.add(categories_id, products_id)
+        transaction.on_commit(pending)
+
+    @classmethod
+    @contextmanager
+    def without_rebuild(cls):
+        """
+        Context manager: the changes of the products within it do not
+        compute again the substitutes (e.g. bulk changes, followed by
+        a build of the substitutes).
+        """
+        _rebuild_state.disabled = getattr(_rebuild_state, 'disabled', 0) + 1
+        try:
+            yield
+        finally:
+            _rebuild_state.disabled -= 1
+
+    @classmethod
+    def invalidate(cls, categories_id):
+        """
+        Delete the precomputed substitutes of the products
+        of the given categories, which are no longer up to date.
+        """
+        cls.objects.filter(
+            product__categories__in=categories_id
+        ).delete()
+
+
+class PendingRebuild:
+    """
+    The substitutes to compute again, before updating the catalogue
+    version, when the current transaction is committed
+    (see 'ProductSubstitute.build_on_commit').
+    """
+
+    def __init__(self):
+        self.categories_id = set()
+        self.products_id = set()
+
+    def add(self, categories_id, products_id=()):
+        self.categories_id.update(categories_id)
+        self.products_id.update(products_id)
+
+    def __call__(self):
+        # the cache layer uses the models of this module
+        from .catalogue_cache import bump_catalogue_version
+        if self.categories_id or self.products_id:
+            ProductSubstitute.rebuild(self.categories_id, self.products_id)
+        bump_catalogue_version()
@@ -0,0 +1,21 @@
+"""
+This module contains the parsing of the request parameters (app 'off_sub').
+"""
+
+
+# highest value of the id columns (integer, on PostgreSQL)
+ID_MAX = 2 ** 31 - 1
+
+
+def parse_id(value):
+    """
+    Return the id (integer) given as a string of ASCII digits,
+    or None if the string is not a valid id (e.g. with other digits,
+    such as "²", or out of the range of the id columns).
+    """
+    if not (value.isascii() and value.isdecimal()):
+        return None
+    value = int(value)
+    if value > ID_MAX:
+        return None
+    return value
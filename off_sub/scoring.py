@@ -0,0 +1,233 @@
+"""
+This module contains the scoring engine of the substitutes (app 'off_sub').
+
+The whole catalogue is loaded as NumPy arrays (one row per product).
+A scorer is a function 'scorer(catalogue, rows, candidates)' which returns
+a matrix of scores, with one line per product in 'rows' and one column per
+candidate substitute in 'candidates' (the higher, the better).
+The engine sums the scores of the scorers listed in SCORERS, weighted,
+and keeps the best candidates of each product (optionally, the most saved
+candidates first among candidates with the same score).
+"""
+
+import numpy as np
+
+from .models import Product
+
+
+# nutrients taken into account, with their reference amount (per 100g)
+NUTRIENTS = [
+    ('fat', 17.5),
+    ('sugars', 22.5),
+    ('salt', 1.5),
+]
+# nutriscore scores range from -15 (best) to 40 (worst)
+NUTRISCORE_RANGE = 55
+# number of cells (products x candidates) of the matrices scored at once:
+# the number of products scored at once depends on the number of candidates
+CELLS_BUDGET = 2 ** 20
+
+
+class Catalogue:
+    """
+    The whole catalogue, as NumPy arrays (one row per product).
+    """
+
+    def __init__(self, ids, categories, nutriscores, nutrients, nb_stores,
+                 favorites):
+        # products id (sorted)
+        self.ids = ids
+        # boolean matrix: products x categories
+        self.categories = categories
+        self.categories_int = categories.astype(np.int32)
+        self.nb_categories = categories.sum(axis=1)
+        self.nutriscores = nutriscores
+        # nutrients per 100g (NaN if unknown): products x NUTRIENTS
+        self.nutrients = nutrients
+        self.nb_stores = nb_stores
+        # number of users who saved each product
+        self.favorites = favorites
+
+    @classmethod
+    def load(cls, categories_id=None):
+        """
+        Load the catalogue (only the products of the given categories
+        if 'categories_id' is not None) from the database, with a constant
+        number of queries. Return the catalogue and the list of categories
+        id (matching the columns of 'categories').
+        """
+        fields = [f"{name}_100g" for name, reference in NUTRIENTS]
+        products = Product.objects.all()
+        categs_links = Product.categories.through.objects.all()
+        stores_links = Product.stores.through.objects.all()
+        if categories_id is not None:
+            products = products.filter(id__in=categs_links.filter(
+                category_id__in=categories_id
+            ).values('product_id'))
+            categs_links = categs_links.filter(product__in=products)
+            stores_links = stores_links.filter(product__in=products)
+        prods = list(
+            products.order_by('id').values_list(
+                'id', 'nutriscore_score', 'favorites_count', *fields
+            )
+        )
+        ids = np.array([prod[0] for prod in prods], dtype=np.int64)
+        nutriscores = np.array([prod[1] for prod in prods], dtype=float)
+        favorites = np.array([prod[2] for prod in prods], dtype=np.int64)
+        # unknown nutrients (None) are converted into NaN
+        nutrients = np.array(
+            [prod[3:] for prod in prods], dtype=float
+        ).reshape(len(prods), len(NUTRIENTS))
+        # links between products and categories
+        links = np.array(
+            list(categs_links.values_list('product_id', 'category_id')),
+            dtype=np.int64
+        ).reshape(-1, 2)
+        categs_id, columns = np.unique(links[:, 1], return_inverse=True)
+        categories = np.zeros((len(ids), len(categs_id)), dtype=bool)
+        categories[np.searchsorted(ids, links[:, 0]), columns] = True
+        # number of stores of each product
+        stores_links = np.array(
+            list(stores_links.values_list('product_id', flat=True)),
+            dtype=np.int64
+        )
+        nb_stores = np.bincount(
+            np.searchsorted(ids, stores_links), minlength=len(ids)
+        )
+        catalogue = cls(
+            ids, categories, nutriscores, nutrients, nb_stores, favorites
+        )
+        return catalogue, list(categs_id)
+
+    def rows_of(self, products_id):
+        """
+        Return the rows of the given products (among those loaded).
+        """
+        return np.flatnonzero(np.isin(self.ids, list(products_id)))
+
+
+# scorers
+
+def category_overlap(catalogue, rows, candidates):
+    """
+    Jaccard index of the categories of the product and the candidate.
+    """
+    categs = catalogue.categories_int
+    inter = categs[rows] @ categs[candidates].T
+    union = (
+        catalogue.nb_categories[rows][:, None]
+        + catalogue.nb_categories[candidates][None, :]
+        - inter
+    )
+    return inter / np.maximum(union, 1)
+
+
+def nutriscore_delta(catalogue, rows, candidates):
+    """
+    Improvement of the nutriscore score (positive if the candidate
+    is better than the product).
+    """
+    return (
+        catalogue.nutriscores[rows][:, None]
+        - catalogue.nutriscores[candidates][None, :]
+    ) / NUTRISCORE_RANGE
+
+
+def nutrients_delta(catalogue, rows, candidates):
+    """
+    Mean improvement of the nutrients (fat, sugars, salt), relatively to
+    their reference amount. Unknown nutrients do not count.
+    """
+    # one nutrient at a time, without a 3-D matrix of the deltas
+    total = np.zeros((len(rows), len(candidates)))
+    for column, (name, reference) in enumerate(NUTRIENTS):
+        values = catalogue.nutrients[:, column] / reference
+        deltas = values[rows][:, None] - values[candidates][None, :]
+        np.nan_to_num(deltas, copy=False, nan=0.0)
+        np.clip(deltas, -1, 1, out=deltas)
+        total += deltas
+    total /= len(NUTRIENTS)
+    return total
+
+
+def store_availability(catalogue, rows, candidates):
+    """
+    1 if the candidate is sold in (at least) one known store, 0 otherwise.
+    """
+    available = (catalogue.nb_stores[candidates] > 0).astype(float)
+    return np.broadcast_to(available, (len(rows), len(candidates)))
+
+
+# scorers used by the engine, with their weight
+SCORERS = [
+    (category_overlap, 1.0),
+    (nutriscore_delta, 2.0),
+    (nutrients_delta, 0.5),
+    (store_availability, 0.1),
+]
+
+
+def rank_substitutes(catalogue, rows, nb_sub, scorers=None,
+                     popularity=False):
+    """
+    Yield, for each product in 'rows', a tuple (row, substitutes rows)
+    with its 'nb_sub' best substitutes, sorted from the best.
+    The candidates share (at least) one category with the product;
+    the product itself is a candidate, so that it is also returned
+    if it is among the best products.
+    If 'popularity', the candidates with the same score are sorted
+    by number of users who saved them.
+    """
+    if scorers is None:
+        scorers = SCORERS
+    # the products with the same categories have the same candidates
+    signatures = {}
+    for row in rows:
+        signature = catalogue.categories[row].tobytes()
+        signatures.setdefault(signature, []).append(row)
+    for group in signatures.values():
+        group_categs = catalogue.categories[group[0]]
+        candidates = np.flatnonzero(
+            catalogue.categories[:, group_categs].any(axis=1)
+        )
+        nb = min(nb_sub, len(candidates))
+        if nb == 0:  # no category, hence no candidate
+            for row in group:
+                yield row, candidates
+            continue
+        chunk_size = max(1, CELLS_BUDGET // len(candidates))
+        for start in range(0, len(group), chunk_size):
+            chunk = np.array(group[start:start + chunk_size])
+            total = np.zeros((len(chunk), len(candidates)))
+            for scorer, weight in scorers:
+                total += weight * scorer(catalogue, chunk, candidates)
+            tiebreak = catalogue.favorites[candidates] if popularity \
+                else None
+            for row, subs in zip(chunk, _top(total, nb, tiebreak)):
+                yield row, candidates[subs]
+
+
+def _top(total, nb, tiebreak=None):
+    """
+    Return the indexes of the 'nb' highest values of each line of 'total',
+    sorted from the highest (ties are sorted by highest 'tiebreak',
+    one value per column, if given, then keep the order of the columns,
+    i.e. of the products id).
+    """
+    if tiebreak is not None:
+        # the columns tied with the nb-th highest value are all sorted
+        nth = -np.partition(-total, nb - 1, axis=1)[:, nb - 1]
+        tops = []
+        for line, threshold in zip(total, nth):
+            columns = np.flatnonzero(line >= threshold)
+            order = np.lexsort(
+                (columns, -tiebreak[columns], -line[columns])
+            )
+            tops.append(columns[order[:nb]])
+        return np.array(tops, dtype=np.int64).reshape(len(total), nb)
+    part = np.argpartition(-total, nb - 1, axis=1)[:, :nb]
+    part.sort(axis=1)
+    order = np.argsort(
+        -np.take_along_axis(total, part, axis=1), axis=1, kind='stable'
+    )
+    return np.take_along_axis(part, order, axis=1)
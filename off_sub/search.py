@@ -0,0 +1,57 @@
+"""
+This module contains the full-text search of the products (app 'off_sub').
+
+On PostgreSQL, the column 'search_vector' of the products is maintained
+by a trigger (French dictionary, without accents), with a GIN index, and
+the matches are ranked with 'ts_rank'. The trigger, its function and the
+index are created by the migration 0016 (which requires the extension
+'unaccent', as the migration 0015 requires 'pg_trgm').
+On the other databases (e.g. SQLite, for the tests), the search falls back
+on case-insensitive substring matches of the words of the query.
+"""
+
+from django.contrib.postgres.search import SearchQueryField, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, Func, Value, When
+
+from .models import Product
+
+
+SEARCH_CONFIG = 'french'
+
+
+def search_products(term):
+    """
+    Return a queryset with the products matching the search 'term',
+    annotated with their 'rank' and sorted from the best match
+    (then from the best nutriscore).
+    """
+    term = term.strip()
+    if not term:
+        return Product.objects.none()
+    if term.isdigit():  # barcode (or the beginning of a barcode)
+        prods = Product.objects.filter(code__startswith=term).annotate(
+            rank=Value(1.0, output_field=FloatField())
+        )
+    elif connections[Product.objects.db].vendor == 'postgresql':
+        query = Func(
+            Value(SEARCH_CONFIG),
+            Func(Value(term), function='unaccent'),
+            function='plainto_tsquery',
+            output_field=SearchQueryField()
+        )
+        prods = Product.objects.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        )
+    else:
+        # fallback: all the words of the term, the names starting
+        # with the term first
+        prods = Product.objects.all()
+        for word in term.split():
+            prods = prods.filter(product_name__icontains=word)
+        prods = prods.annotate(rank=Case(
+            When(product_name__istartswith=term, then=Value(1.0)),
+            default=Value(0.5),
+            output_field=FloatField()
+        ))
+    return prods.order_by('-rank', 'nutriscore_score', 'id')
@@ -0,0 +1,63 @@
+"""
+This module contains the signal receivers (app 'off_sub').
+"""
+
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete
+)
+from django.dispatch import receiver
+
+from .models import Product, ProductSubstitute
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs):
+    """
+    Update the catalogue version (after the commit) when a product
+    is saved or deleted.
+    """
+    ProductSubstitute.build_on_commit()
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+@receiver(m2m_changed, sender=Product.stores.through)
+def product_links_changed(sender, action, **kwargs):
+    """
+    Update the catalogue version (after the commit) when the categories
+    or the stores of a product change.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        ProductSubstitute.build_on_commit()
+
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def product_substitutes_outdated(sender, instance, **kwargs):
+    """
+    Compute again (after the commit) the precomputed substitutes
+    which may change when a product is saved or deleted.
+    """
+    categories_id = list(instance.categories.values_list('id', flat=True))
+    if categories_id:
+        ProductSubstitute.build_on_commit(categories_id)
+
+
+@receiver(m2m_changed, sender=Product.categories.through)
+def product_categories_changed(sender, instance, action, reverse, pk_set,
+                               **kwargs):
+    """
+    Compute again (after the commit) the precomputed substitutes
+    which may change when the categories of a product change.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:  # 'instance' is a category
+        categories_id = [instance.id]
+        products_id = set(pk_set or [])
+    else:  # 'instance' is a product
+        categories_id = set(pk_set or [])
+        categories_id.update(instance.categories.values_list('id', flat=True))
+        products_id = [instance.id]
+    if categories_id:
+        ProductSubstitute.build_on_commit(categories_id, products_id)
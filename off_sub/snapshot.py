@@ -0,0 +1,263 @@
+"""
+This module contains the snapshots of the catalogue (app 'off_sub').
+
+A snapshot is a compact JSON Lines file (optionally compressed with gzip):
+- the first line describes the format and the fields of each model,
+- each other line is a record: [model name, field values...],
+  with the categories and the stores of a product as lists of id.
+The records are written and read one by one (constant memory), and loaded
+by batch with bulk queries, in one transaction.
+The Django fixtures of the catalogue (e.g. "off_sub/dumps/off_sub.json")
+can also be loaded, stream-parsed.
+"""
+
+import gzip
+import json
+import re
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from .importer import NUTRIMENTS_FIELDS, set_nutriments_100g
+from .models import Category, Product, Store
+
+
+SNAPSHOT_FORMAT = 'off_sub.catalogue'
+SNAPSHOT_VERSION = 1
+# models of the catalogue, in the order of the dependencies
+SNAPSHOT_MODELS = {
+    'category': Category,
+    'store': Store,
+    'product': Product,
+}
+# many-to-many fields of the products, recorded as lists of id
+PRODUCT_LINKS = ['categories', 'stores']
+# number of records inserted per query
+BATCH_SIZE = 1000
+# number of records updated per query (bounds the size of the queries)
+UPDATE_BATCH_SIZE = 100
+# size of the chunks read from the Django fixtures
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[\s,]*")
+
+
+def open_snapshot(path, mode):
+    """
+    Open a snapshot in text mode, compressed with gzip if its name
+    ends with ".gz".
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    return opener(path, mode + "t", encoding="utf-8")
+
+
+def model_fields(model):
+    """
+    Return the names of the columns of a model (e.g. 'id', 'name'),
+    except the ones maintained by the database (e.g. 'search_vector').
+    """
+    return [
+        field.attname for field in model._meta.concrete_fields
+        if field.editable
+    ]
+
+
+def link_column(link_name):
+    """
+    Return the through model of a many-to-many field of the products,
+    and the name of the column of the linked object (e.g. 'store_id').
+    """
+    field = Product._meta.get_field(link_name)
+    through = field.remote_field.through
+    column = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    return through, column
+
+
+def dump_catalogue(stream):
+    """
+    Write a snapshot of the catalogue in 'stream' (text file).
+    Return the number of records (categories, stores and products).
+    """
+    fields = {
+        name: model_fields(model) for name, model in SNAPSHOT_MODELS.items()
+    }
+    fields['product'] += PRODUCT_LINKS
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'fields': fields,
+    }
+    stream.write(json.dumps(header) + "\n")
+    # links between products and categories / stores
+    links = {}
+    for link_name in PRODUCT_LINKS:
+        through, other = link_column(link_name)
+        links[link_name] = {}
+        for prod_id, other_id in through.objects.order_by('id').values_list(
+            'product_id', other
+        ).iterator():
+            links[link_name].setdefault(prod_id, []).append(other_id)
+    counter = 0
+    for name, model in SNAPSHOT_MODELS.items():
+        columns = model_fields(model)
+        for values in model.objects.order_by('pk').values_list(
+            *columns
+        ).iterator():
+            record = [name, *values]
+            if model is Product:
+                record += [
+                    links[link_name].get(values[0], [])
+                    for link_name in PRODUCT_LINKS
+                ]
+            stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            counter += 1
+    return counter
+
+
+def iter_snapshot(stream):
+    """
+    Generator: yield the records of a snapshot as tuples
+    (model name, dict of values).
+    """
+    header = json.loads(stream.readline() or "{}")
+    if header.get('format') != SNAPSHOT_FORMAT or \
+            header.get('version') != SNAPSHOT_VERSION:
+        raise ValueError("unknown snapshot format")
+    fields = header['fields']
+    for line in stream:
+        if line.strip():
+            name, *values = json.loads(line)
+            yield name, dict(zip(fields[name], values))
+
+
+def iter_fixture(stream):
+    """
+    Generator: yield the records of the catalogue from a Django fixture
+    (JSON array), stream-parsed, as tuples (model name, dict of values).
+    The records of the other models are ignored.
+    """
+    for obj in iter_json_array(stream):
+        app_label, name = obj['model'].split(".")
+        if app_label != Product._meta.app_label or \
+                name not in SNAPSHOT_MODELS:
+            continue
+        values = {'id': obj['pk']}
+        model = SNAPSHOT_MODELS[name]
+        for field, value in obj['fields'].items():
+            if field in PRODUCT_LINKS:
+                values[field] = value
+            else:
+                values[model._meta.get_field(field).attname] = value
+        yield name, values
+
+
+def iter_json_array(stream, chunk_size=CHUNK_SIZE):
+    """
+    Generator: yield the items of a JSON array read from 'stream',
+    chunk by chunk (without loading the whole array in memory).
+    """
+    decoder = json.JSONDecoder()
+    buffer = stream.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("not a JSON array")
+    pos = 1
+    while True:
+        pos = _WHITESPACE.match(buffer, pos).end()
+        if buffer.startswith("]", pos):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            # incomplete item: read the next chunk
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield item
+        pos = end
+
+
+def load_catalogue(records, batch_size=BATCH_SIZE):
+    """
+    Record the catalogue from the records (model name, dict of values)
+    issued from 'iter_snapshot' or 'iter_fixture', by batch, in one
+    transaction. The records already in database (same id) are updated.
+    Return a dict with the number of records per model.
+    """
+    counters = {name: 0 for name in SNAPSHOT_MODELS}
+    batch = []
+    batch_name = None
+    with transaction.atomic():
+        for name, values in records:
+            if batch and (name != batch_name or len(batch) >= batch_size):
+                counters[batch_name] += _load_batch(batch_name, batch)
+                batch = []
+            batch_name = name
+            batch.append(values)
+        if batch:
+            counters[batch_name] += _load_batch(batch_name, batch)
+        # the next id of the tables follow the loaded records (PostgreSQL)
+        sequences_sql = connection.ops.sequence_reset_sql(
+            no_style(), list(SNAPSHOT_MODELS.values())
+        )
+        with connection.cursor() as cursor:
+            for sql in sequences_sql:
+                cursor.execute(sql)
+    return counters
+
+
+def _load_batch(name, batch):
+    """
+    Record a batch of records of the model 'name',
+    with a constant number of queries.
+    """
+    model = SNAPSHOT_MODELS[name]
+    # the columns missing from the records (e.g. the columns added after
+    # a Django fixture was dumped) are left unchanged in database
+    provided = set().union(*batch)
+    columns = [field for field in model_fields(model) if field in provided]
+    objs = [
+        model(**{
+            field: value for field, value in values.items()
+            if field in columns
+        })
+        for values in batch
+    ]
+    nutriments = [f"{field}_100g" for field in NUTRIMENTS_FIELDS]
+    if model is Product and not provided.issuperset(nutriments):
+        # the nutriments per 100g are set from the formatted nutriments
+        for obj in objs:
+            set_nutriments_100g(obj)
+        columns += [field for field in nutriments if field not in columns]
+    # only the new and changed records are written
+    existing = {
+        values[0]: values
+        for values in model.objects.filter(
+            pk__in=[obj.pk for obj in objs]
+        ).values_list(*columns)
+    }
+    model.objects.bulk_create(
+        [obj for obj in objs if obj.pk not in existing]
+    )
+    model.objects.bulk_update(
+        [
+            obj for obj in objs if obj.pk in existing and
+            existing[obj.pk] != tuple(getattr(obj, col) for col in columns)
+        ],
+        columns[1:],
+        batch_size=UPDATE_BATCH_SIZE
+    )
+    if model is Product:
+        for link_name in PRODUCT_LINKS:
+            through, other = link_column(link_name)
+            through.objects.bulk_create(
+                [
+                    through(product_id=values['id'], **{other: other_id})
+                    for values in batch
+                    for other_id in values.get(link_name, [])
+                ],
+                ignore_conflicts=True
+            )
+    return len(objs)
@@ -1,17 +1,70 @@
 // Code from jQuery UI Autocomplete
 // The purpose is helping the user to find a product in the database
 
+// The suggestions are requested to the server, as the user types
+
+// number of suggestions displayed
+const suggestionsLimit = 10;
+
+// return a jQuery UI source, which requests the suggestions to the server
+function remoteSource(inputElt) {
+  return function (request, response) {
+    $.ajax({
+      type: 'GET',
+      url: inputElt.attr('ajax-suggest-url'),
+      data: {
+        'q': request.term,
+        'limit': suggestionsLimit
+      },
+      dataType: 'json',
+      success: function (data) {
+        response(data.suggestions);
+      },
+      error: function () {
+        // no suggestion, the user can still submit the search
+        response([]);
+      }
+    });
+  };
+}
+
+// The product pages may be served from the cache (anonymous users):
+// their forms contain the CSRF token of another user, so the token
+// of the 'csrftoken' cookie is used instead
+
+// return the value of a cookie, or null
+function getCookie(name) {
+  var cookies = document.cookie ? document.cookie.split('; ') : [];
+  for (let i = 0; i < cookies.length; i++) {
+    var parts = cookies[i].split('=');
+    if (parts[0] === name) {
+      return decodeURIComponent(parts.slice(1).join('='));
+    }
+  }
+  return null;
+}
+
+// set the CSRF token of the cookie in the hidden inputs of the forms
+function refreshCsrfTokens() {
+  var token = getCookie('csrftoken');
+  if (token !== null) {
+    $( 'input[name=csrfmiddlewaretoken]' ).val(token);
+  }
+}
+
 $( function() {
-  var allProducts = JSON.parse(
-    document.getElementById('pythonProducts').textContent
-  );
+  refreshCsrfTokens();
   // autocomplete search field in navbar
   $( "#autocompletion-0" ).autocomplete({
-    source: allProducts
+    source: remoteSource($( "#autocompletion-0" )),
+    minLength: 2,
+    delay: 200
   });
   // autocomplete search field in home page (masthead section)
   $( "#autocompletion-1" ).autocomplete({
-    source: allProducts
+    source: remoteSource($( "#autocompletion-1" )),
+    minLength: 2,
+    delay: 200
   });
 } );
 
@@ -39,6 +92,7 @@ for (let i = 0; i < formEltsCounter; i++) {
   // listen if a search form is submitted
   elts[i].addEventListener("submit", function (e) {
     e.preventDefault();
+    refreshCsrfTokens();
     // get the input text
     var productString = document.getElementById(`autocompletion-${i}`).value;
     // if there is an input
@@ -53,6 +107,11 @@ for (let i = 0; i < formEltsCounter; i++) {
         },
         dataType: 'json',
         success: function (data) {
+          if (data.product_id === undefined) {
+            // no product picked: redirect to the search page
+            window.location.href = data.search_url;
+            return;
+          }
           // redirect to the product page
           var action = elts[i].getAttribute("action");
           var newAction = action.replace("0", `${data.product_id}`);
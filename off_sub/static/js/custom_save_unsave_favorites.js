@@ -1,103 +1,93 @@
-// SAVE: add a product in the user's favorites
-var btnElts = document.getElementsByClassName('saveProduct');
-var btnEltsCounter = btnElts.length;
-
-const eltsSave = []
-
-// iterate on each "save" button
-for (let i = 0; i < btnEltsCounter; i++) {
-  var btnEltI = document.getElementsByClassName('saveProduct')[i];
-  eltsSave.push(btnEltI);
-
-  // listen if a "save" button is clicked
-  eltsSave[i].addEventListener("click", function (e) {
-    e.preventDefault();
-    // execute AJAX POST request
-    $.ajax({
-      type: 'POST',
-      url: eltsSave[i].getAttribute('ajax-save-product-url'),
-      data: {
-        'product_id': eltsSave[i].getAttribute('property'),
-        csrfmiddlewaretoken:$( 'input[name=csrfmiddlewaretoken]' ).val()
-      },
-      dataType: 'json',
-      success: function (data) {
-        // replace the "save" button by the "unsave" button
-        var formId = document.getElementById(`${data.product_id}`);
-        var blockCounter = formId.getElementsByClassName('d-block').length;
-        for (let j = 0; j < blockCounter; j++) {
-          var divElt = formId.getElementsByClassName('d-block')[j];
-          divElt.setAttribute("class", "d-temp");
-          // we can also use 'j' for "d-none" because there are as many "d-none" as "d-block"
-          var divElt = formId.getElementsByClassName('d-none')[j];
-          divElt.setAttribute("class", "d-block");
-          // we can also use 'j' for "d-temp" due to previous action ("d-block > "d-temp")
-          var divElt = formId.getElementsByClassName('d-temp')[j];
-          divElt.setAttribute("class", "d-none");
-        }
-      }
-    });
-  });
-}
+// SAVE / UNSAVE: set the state of a product in the user's favorites
 
+// The buttons are switched at once, and the clicks are coalesced:
+// the state is sent after a short delay without click, with one request
+// at a time per product, and only if it differs from the server's state
 
+// delay (in milliseconds) after the last click, before sending the state
+const favoriteDelay = 400;
 
+// state of each product: {formElt, saved, serverSaved, timer, inFlight}
+const favoriteStates = {};
 
-// UNSAVE: remove a product from the user's favorites
-var btnElts = document.getElementsByClassName('unsaveProduct');
-var btnEltsCounter = btnElts.length;
-
-const eltsUnsave = []
+// return the state of the product of a form
+function getFavoriteState(formElt) {
+  var productId = formElt.getAttribute('id');
+  if (favoriteStates[productId] === undefined) {
+    // the displayed button ('d-block') is the "unsave" one if saved
+    var blockElt = formElt.getElementsByClassName('d-block')[0];
+    var saved = blockElt.getElementsByClassName('unsaveProduct').length > 0;
+    favoriteStates[productId] = {
+      formElt: formElt,
+      saved: saved,
+      serverSaved: saved,
+      timer: null,
+      inFlight: false
+    };
+  }
+  return favoriteStates[productId];
+}
 
-// iterate on each "save" button
-for (let i = 0; i < btnEltsCounter; i++) {
-  var btnEltI = document.getElementsByClassName('unsaveProduct')[i];
-  eltsUnsave.push(btnEltI);
+// display the "unsave" button if the product is saved, else the "save" one
+function displayFavoriteButtons(state) {
+  var unsaveElt = state.formElt.getElementsByClassName('unsaveProduct')[0];
+  var saveElt = state.formElt.getElementsByClassName('saveProduct')[0];
+  unsaveElt.parentElement.setAttribute("class", state.saved ? "d-block" : "d-none");
+  saveElt.parentElement.setAttribute("class", state.saved ? "d-none" : "d-block");
+}
 
-  // listen if a "save" button is clicked
-  eltsUnsave[i].addEventListener("click", function (e) {
-    e.preventDefault();
-    // execute AJAX POST request
-    $.ajax({
-      type: 'POST',
-      url: eltsUnsave[i].getAttribute('ajax-unsave-product-url'),
-      data: {
-        'product_id': eltsUnsave[i].getAttribute('property'),
-        csrfmiddlewaretoken:$( 'input[name=csrfmiddlewaretoken]' ).val()
-      },
-      dataType: 'json',
-      success: function (data) {
-        // replace the "unsave" button by the "save" button
-        var formId = document.getElementById(`${data.product_id}`);
-        var blockCounter = formId.getElementsByClassName('d-block').length;
-        for (let j = 0; j < blockCounter; j++) {
-          var divElt = formId.getElementsByClassName('d-block')[j];
-          divElt.setAttribute("class", "d-temp");
-          // we can also use 'j' for "d-none" because there are as many "d-none" as "d-block"
-          var divElt = formId.getElementsByClassName('d-none')[j];
-          divElt.setAttribute("class", "d-block");
-          // we can also use 'j' for "d-temp" due to previous action ("d-block > "d-temp")
-          var divElt = formId.getElementsByClassName('d-temp')[j];
-          divElt.setAttribute("class", "d-none");
-        }
+// send the state of a product, if it differs from the server's state
+function sendFavoriteState(productId) {
+  var state = favoriteStates[productId];
+  state.timer = null;
+  if (state.inFlight || state.saved === state.serverSaved) {
+    return;
+  }
+  state.inFlight = true;
+  // execute AJAX POST request
+  $.ajax({
+    type: 'POST',
+    url: state.formElt.getAttribute('ajax-set-favorite-url'),
+    data: {
+      'product_id': productId,
+      'saved': state.saved ? 'true' : 'false',
+      csrfmiddlewaretoken:$( 'input[name=csrfmiddlewaretoken]' ).val()
+    },
+    dataType: 'json',
+    success: function (data) {
+      state.serverSaved = data.saved;
+    },
+    error: function () {
+      // back to the server's state
+      state.saved = state.serverSaved;
+      displayFavoriteButtons(state);
+    },
+    complete: function () {
+      state.inFlight = false;
+      // the clicks during the request (unless a new delay is running)
+      if (state.timer === null) {
+        sendFavoriteState(productId);
       }
-    });
+    }
   });
 }
 
+// listen if a "save" or "unsave" button is clicked
+var btnElts = document.querySelectorAll('.saveProduct, .unsaveProduct');
 
-// var save_form = $('#save');
-// save_form.submit(function () {
-//   $.ajax({
-//     type: save_form.attr('method'),
-//     url: save_form.attr('action'),
-//     data: save_form.serialize(),
-//     success: function (data) {
-//       $("#SOME-DIV").html(data);
-//     },
-//     error: function(data) {
-//       $("#MESSAGE-DIV").html("Something went wrong!");
-//     }
-//   });
-//   return false;
-// });
\ No newline at end of file
+for (let i = 0; i < btnElts.length; i++) {
+  btnElts[i].addEventListener("click", function (e) {
+    e.preventDefault();
+    var state = getFavoriteState(btnElts[i].closest('form'));
+    state.saved = btnElts[i].classList.contains('saveProduct');
+    displayFavoriteButtons(state);
+    // (re)start the delay before sending the state
+    if (state.timer !== null) {
+      clearTimeout(state.timer);
+    }
+    var productId = btnElts[i].getAttribute('property');
+    state.timer = setTimeout(function () {
+      sendFavoriteState(productId);
+    }, favoriteDelay);
+  });
+}
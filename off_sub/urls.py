@@ -11,20 +11,61 @@ urlpatterns = [
     path('legal/', views.legal, name="legal"),
     path('results/<product_id>', views.results, name="results"),
     path('results_/<product_id>', views.results_login, name="results_login"),
+    path('search/', views.search, name="search"),
 
+    path(
+        'ajax_cache_stats',
+        ajax_views.ajax_cache_stats,
+        name="ajax_cache_stats"
+    ),
+    path(
+        'ajax_find_barcode',
+        ajax_views.ajax_find_barcode,
+        name="ajax_find_barcode"
+    ),
     path(
         'ajax_find_product',
         ajax_views.ajax_find_product,
         name="ajax_find_product"
     ),
+    path(
+        'ajax_resolve_products',
+        ajax_views.ajax_resolve_products,
+        name="ajax_resolve_products"
+    ),
     path(
         'ajax_save_product',
         ajax_views.ajax_save_product,
         name="ajax_save_product"
     ),
+    path(
+        'ajax_save_products',
+        ajax_views.ajax_save_products,
+        name="ajax_save_products"
+    ),
+    path(
+        'ajax_set_favorite',
+        ajax_views.ajax_set_favorite,
+        name="ajax_set_favorite"
+    ),
     path(
         'ajax_unsave_product',
         ajax_views.ajax_unsave_product,
         name="ajax_unsave_product"
     ),
+    path(
+        'ajax_unsave_products',
+        ajax_views.ajax_unsave_products,
+        name="ajax_unsave_products"
+    ),
+    path(
+        'ajax_substitutes/<int:product_id>',
+        ajax_views.ajax_substitutes,
+        name="ajax_substitutes"
+    ),
+    path(
+        'ajax_suggest',
+        ajax_views.ajax_suggest,
+        name="ajax_suggest"
+    ),
 ]
@@ -1,15 +1,58 @@
+from urllib.parse import urlencode
+
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.sites.models import Site
+from django.core.paginator import Paginator
+
+from auth.models import Favorite
+from .decorators import cache_anonymous_page
+from .models import Category, Product
+from .params import parse_id
+from .search import search_products
+
 
-from .models import Product
+# nutriscore grades of the products (filter of the favorites)
+NUTRISCORE_GRADES = ['a', 'b', 'c', 'd', 'e']
+# number of most saved healthy products displayed on the home page
+MOST_SAVED_NB = 6
 
 
 @login_required
 def favorites(request):
     context = {}
-    context['user_favorites'] = request.user.favorites.all()  # QuerySet
-    context['products_list'] = context['user_favorites']
+    # sort and filters
+    sort = request.GET.get('sort', "")
+    if sort not in Favorite.SORTS:
+        sort = 'recent'
+    grade = request.GET.get('grade', "")
+    if grade not in NUTRISCORE_GRADES:
+        grade = ""
+    category = request.GET.get('category', "")
+    category_id = parse_id(category)
+    after = request.GET.get('after', "")
+    favs = Favorite.filter_favorites(request.user, grade, category_id)
+    # the page following the favorite 'after'
+    page, next_after = Favorite.get_page(
+        favs, sort, parse_id(after)
+    )
+    context['favorites_count'] = favs.count()
+    context['products_list'] = [fav.product for fav in page]
+    context['user_favorite_ids'] = {
+        prod.id for prod in context['products_list']
+    }
+    context['categories'] = Category.objects.order_by('name')
+    context['grades'] = NUTRISCORE_GRADES
+    context['sort'] = sort
+    context['grade'] = grade
+    context['category_id'] = category_id
+    filters = {'sort': sort, 'grade': grade, 'category': category_id or ""}
+    context['first_query'] = urlencode(filters)
+    if next_after is not None:
+        context['next_query'] = urlencode(
+            dict(filters, after=next_after)
+        )
+    context['is_first_page'] = not after
     current_url = request.get_full_path().strip(
         Site.objects.get_current().domain
     )
@@ -21,6 +64,7 @@ def favorites(request):
     )
 
 
+@cache_anonymous_page
 def food(request, product_id):
     context = {}
     product = get_object_or_404(Product, id=product_id)
@@ -41,6 +85,7 @@ def food(request, product_id):
 
 def index(request):
     context = {}
+    context['most_saved'] = Product.get_most_saved(MOST_SAVED_NB)
     return render(
         request,
         'off_sub/index.html',
@@ -57,13 +102,15 @@ def legal(request):
     )
 
 
+@cache_anonymous_page
 def results(request, product_id):
     context = {}
-    if request.user.is_authenticated:
-        context['user_favorites'] = request.user.favorites.all()  # QuerySet
     product = get_object_or_404(Product, id=product_id)
     # number of suggested substitutes: 6
     subs = product.get_best_subs(6)
+    if request.user.is_authenticated:
+        # id of the displayed products among the user's favorites
+        context['user_favorite_ids'] = request.user.get_favorite_ids(subs)
     context['products_list'] = subs  # QuerySet
     context['initial_product'] = product
     current_url = request.get_full_path().strip(
@@ -80,3 +127,28 @@ def results(request, product_id):
 @login_required
 def results_login(request, product_id):
     return results(request, product_id)
+
+
+def search(request):
+    context = {}
+    query = request.GET.get('q', "").strip()
+    # number of products per page: 12
+    paginator = Paginator(search_products(query), 12)
+    page = paginator.get_page(request.GET.get('page'))
+    if request.user.is_authenticated:
+        # id of the displayed products among the user's favorites
+        context['user_favorite_ids'] = request.user.get_favorite_ids(
+            page.object_list
+        )
+    context['query'] = query
+    context['page'] = page
+    context['products_list'] = page.object_list
+    current_url = request.get_full_path().strip(
+        Site.objects.get_current().domain
+    )
+    context['current_url'] = current_url
+    return render(
+        request,
+        'off_sub/search.html',
+        context,
+    )
@@ -84,7 +84,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'off_sub.context_processors.pur_beurre_all_products',
+                'off_sub.context_processors.pur_beurre_catalogue_version',
                 'off_sub.context_processors.pur_beurre_user_authenticated',
 
             ],
@@ -111,6 +111,35 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+if os.environ.get('ENV') == 'PRODUCTION':
+    # shared by all the workers
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get(
+                'CACHE_LOCATION', '/tmp/pur_beurre_cache'
+            ),
+            # room for the cached pages of the products
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            # room for the cached pages of the products
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
+# Substitutes
+# the most saved products first among equivalent substitutes
+# (see the command 'build_substitutes')
+SUBSTITUTES_POPULARITY = os.environ.get('SUBSTITUTES_POPULARITY') == '1'
+
 # Authentication
 # User substitution
 AUTH_USER_MODEL = 'my_auth.MyUser'
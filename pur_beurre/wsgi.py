@@ -10,7 +10,16 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/wsgi/
 import os
 
 from django.core.wsgi import get_wsgi_application
+from django.db import DatabaseError
 
 os.environ['DJANGO_SETTINGS_MODULE'] = 'pur_beurre.settings'
 
 application = get_wsgi_application()
+
+# build the map of the barcodes before the first request (app 'off_sub')
+from off_sub.barcodes import warm_barcodes  # noqa: E402
+
+try:
+    warm_barcodes()
+except DatabaseError:  # e.g. database not migrated yet: built on demand
+    pass
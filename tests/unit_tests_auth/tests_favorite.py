@@ -0,0 +1,195 @@
+"""
+This module contains the unit tests related to the 'Favorite' class.
+"""
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from auth.models import Favorite, MyUser
+from off_sub.models import Category, Product
+
+
+class FavoriteTestCase(TestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create_user(
+            email="toto@mail.com",
+            first_name="Toto"
+        )
+        self.desserts = Category.objects.create(name="desserts")
+        self.pizzas = Category.objects.create(name="pizzas")
+        # saved in this order, with the scores 2, 0, 4, 1, 3
+        self.products = []
+        for i, score in enumerate([2, 0, 4, 1, 3]):
+            product = Product.objects.create(
+                code=f'{i}' * 13,
+                product_name=f"product {i}",
+                nutriscore_grade='ab'[i % 2],
+                nutriscore_score=score,
+            )
+            product.categories.add(self.pizzas if i == 4 else self.desserts)
+            self.user.favorites.add(product)
+            self.products.append(product)
+
+    def get_all_pages(self, favs, sort, size=2):
+        """
+        Return the list of the pages (lists of products id),
+        following the next pages.
+        """
+        pages = []
+        after = None
+        while True:
+            page, after = Favorite.get_page(favs, sort, after, size)
+            pages.append([fav.product_id for fav in page])
+            if after is None:
+                return pages
+
+    def test_get_page_recent_first(self):
+        """
+        Test that the pages follow each other, from the latest favorite.
+        """
+        ids = [prod.id for prod in self.products]
+        favs = Favorite.filter_favorites(self.user)
+        self.assertEqual(
+            self.get_all_pages(favs, 'recent'),
+            [[ids[4], ids[3]], [ids[2], ids[1]], [ids[0]]]
+        )
+        self.assertEqual(
+            self.get_all_pages(favs, 'oldest', size=5), [ids]
+        )
+
+    def test_get_page_by_nutriscore(self):
+        """
+        Test that the pages follow each other, from the best nutriscore.
+        """
+        ids = [prod.id for prod in self.products]
+        favs = Favorite.filter_favorites(self.user)
+        self.assertEqual(
+            self.get_all_pages(favs, 'nutriscore'),
+            [[ids[1], ids[3]], [ids[0], ids[4]], [ids[2]]]
+        )
+
+    def test_get_page_same_dates(self):
+        """
+        Test that the favorites saved at the same time (e.g. before the
+        dates were recorded) are paginated without loss.
+        """
+        Favorite.objects.update(created_at=Favorite.objects.first().created_at)
+        favs = Favorite.filter_favorites(self.user)
+        pages = self.get_all_pages(favs, 'recent')
+        self.assertEqual(
+            sorted(sum(pages, [])), sorted(prod.id for prod in self.products)
+        )
+
+    def test_filter_favorites(self):
+        """
+        Test that the favorites are filtered by grade and category.
+        """
+        favs = Favorite.filter_favorites(self.user, 'a', self.desserts.id)
+        self.assertEqual(
+            sorted(favs.values_list('product_id', flat=True)),
+            [self.products[0].id, self.products[2].id]
+        )
+        self.assertEqual(favs.count(), 2)
+
+    def test_add_and_remove_favorites(self):
+        """
+        Test that several favorites are saved (the unknown and the already
+        saved products being ignored), then unsaved.
+        """
+        Favorite.objects.all().delete()
+        ids = [prod.id for prod in self.products]
+        self.user.favorites.add(self.products[0])
+        saved = Favorite.add_favorites(self.user, ids[:3] + [0])
+        self.assertEqual(sorted(saved), ids[:3])
+        self.assertEqual(
+            sorted(self.user.favorites.values_list('id', flat=True)), ids[:3]
+        )
+        deleted = Favorite.remove_favorites(self.user, ids[1:])
+        self.assertEqual(deleted, 2)
+        self.assertEqual(list(self.user.favorites.all()), [self.products[0]])
+
+    def test_set_favorite_idempotent(self):
+        """
+        Test that the state of a favorite is set, and that nothing
+        is written when it is already in this state.
+        """
+        prod_id = self.products[0].id
+        with self.assertNumQueries(1):
+            self.assertFalse(Favorite.set_favorite(self.user, prod_id, True))
+        self.assertTrue(Favorite.set_favorite(self.user, prod_id, False))
+        self.assertFalse(self.user.favorites.filter(id=prod_id).exists())
+        with self.assertNumQueries(1):
+            self.assertFalse(Favorite.set_favorite(self.user, prod_id, False))
+        self.assertTrue(Favorite.set_favorite(self.user, prod_id, True))
+        self.assertTrue(self.user.favorites.filter(id=prod_id).exists())
+        self.assertIsNone(Favorite.set_favorite(self.user, 0, True))
+
+    def get_counts(self):
+        """
+        Return the counters of favorites of the products (in order).
+        """
+        return [
+            Product.objects.get(id=prod.id).favorites_count
+            for prod in self.products
+        ]
+
+    def test_favorites_counts_maintained(self):
+        """
+        Test that the counters of favorites follow the saved
+        and unsaved favorites.
+        """
+        # the favorites of 'setUp' are saved without the counters
+        self.assertEqual(Favorite.reconcile_counts(), 5)
+        other_user = MyUser.objects.create_user(
+            email="titi@mail.com",
+            first_name="Titi"
+        )
+        ids = [prod.id for prod in self.products]
+        Favorite.add_favorites(other_user, ids[:2])
+        Favorite.add_favorites(other_user, ids[:3])
+        self.assertEqual(self.get_counts(), [2, 2, 2, 1, 1])
+        Favorite.set_favorite(other_user, ids[0], False)
+        Favorite.set_favorite(other_user, ids[0], False)
+        Favorite.set_favorite(self.user, ids[4], False)
+        self.assertEqual(self.get_counts(), [1, 2, 2, 1, 0])
+        Favorite.remove_favorites(self.user, ids)
+        self.assertEqual(self.get_counts(), [0, 1, 1, 0, 0])
+        self.assertEqual(Favorite.reconcile_counts(), 0)
+
+    def test_favorites_counted_once_when_concurrent(self):
+        """
+        Test that the counters of favorites only count the favorites
+        actually inserted or deleted, when the state read first is no
+        longer up to date (e.g. two tabs, or a retried request).
+        """
+        Favorite.reconcile_counts()
+        prod_id = self.products[0].id
+        with mock.patch.object(
+            Favorite, '_get_states', return_value={prod_id: False}
+        ):
+            self.assertFalse(Favorite.set_favorite(self.user, prod_id, True))
+            Favorite.add_favorites(self.user, [prod_id])
+        self.assertEqual(self.get_counts()[0], 1)
+        Favorite.remove_favorites(self.user, [prod_id])
+        with mock.patch.object(
+            Favorite, '_get_states', return_value={prod_id: True}
+        ):
+            self.assertFalse(Favorite.set_favorite(self.user, prod_id, False))
+        self.assertEqual(self.get_counts()[0], 0)
+        self.assertEqual(Favorite.reconcile_counts(), 0)
+
+    def test_reconcile_favorites_counts_command(self):
+        """
+        Test that the command sets the counters which have drifted.
+        """
+        Product.objects.filter(id=self.products[0].id).update(
+            favorites_count=7
+        )
+        out = StringIO()
+        call_command('reconcile_favorites_counts', stdout=out)
+        self.assertIn("5 produits", out.getvalue())
+        self.assertEqual(self.get_counts(), [1, 1, 1, 1, 1])
@@ -5,6 +5,7 @@ This module contains the unit tests related to the 'MyUserManager' class.
 from django.test import TestCase
 
 from auth.models import MyUser
+from off_sub.models import Product
 
 
 class MyUserTestCase(TestCase):
@@ -64,6 +65,25 @@ class MyUserTestCase(TestCase):
             text = str(e)
         self.assertEqual(text, "Le courriel est requis pour s'inscrire.")
 
+    def test_get_favorite_ids(self):
+        """
+        Test that the favorites among the given products are returned
+        (as a set of id), with one query.
+        """
+        products = [
+            Product.objects.create(
+                code=f'{i}' * 13,
+                product_name=f"product {i}",
+                nutriscore_grade='a',
+                nutriscore_score=i,
+            )
+            for i in range(3)
+        ]
+        self.user_a.favorites.add(products[0], products[2])
+        with self.assertNumQueries(1):
+            favorite_ids = self.user_a.get_favorite_ids(products[:2])
+        self.assertEqual(favorite_ids, {products[0].id})
+
     def test_str_user(self):
         """
         Test if user printing is correct.
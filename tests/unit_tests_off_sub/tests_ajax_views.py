@@ -0,0 +1,365 @@
+"""
+This module contains the unit tests related
+to the ajax views (app 'off_sub').
+"""
+
+from django.core.cache import cache
+from django.urls import reverse
+from django.test import TestCase
+
+from auth.models import MyUser
+from off_sub.barcodes import get_barcodes_map
+from off_sub.catalogue_cache import bump_catalogue_version
+from off_sub.models import Category, Product, ProductSubstitute
+
+
+class FindProductTestCase(TestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            code='1234567890123',
+            product_name="a superb product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+
+    def test_find_product_returns_product_id(self):
+        """
+        Test that the id of the product picked by the user is returned.
+        """
+        response = self.client.post(
+            reverse('off_sub:ajax_find_product'),
+            {'product_string': str(self.product)}
+        )
+        self.assertEqual(response.json(), {'product_id': self.product.id})
+
+    def test_find_product_returns_search_url(self):
+        """
+        Test that the url of the search page is returned
+        if the user did not pick a product.
+        """
+        response = self.client.post(
+            reverse('off_sub:ajax_find_product'),
+            {'product_string': "superb product"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {'search_url': reverse('off_sub:search') + "?q=superb+product"}
+        )
+
+
+class SuggestTestCase(TestCase):
+
+    def setUp(self):
+        self.product_a = Product.objects.create(
+            code='1234567890123',
+            product_name="a superb product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+        self.product_b = Product.objects.create(
+            code='2222222222222',
+            product_name="a new product",
+            nutriscore_grade='b',
+            nutriscore_score=1,
+        )
+
+    def test_suggest_returns_matching_products(self):
+        """
+        Test that the suggestions match the term typed by the user.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_suggest'),
+            {'q': "a sup"}
+        )
+        self.assertEqual(
+            response.json()['suggestions'],
+            [str(self.product_a)]
+        )
+
+    def test_suggest_with_limit(self):
+        """
+        Test that the number of suggestions is limited as requested.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_suggest'),
+            {'q': "a ", 'limit': 1}
+        )
+        self.assertEqual(len(response.json()['suggestions']), 1)
+
+    def test_suggest_with_invalid_limit(self):
+        """
+        Test that an invalid limit falls back to the default one.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_suggest'),
+            {'q': "a ", 'limit': "foo"}
+        )
+        self.assertEqual(len(response.json()['suggestions']), 2)
+
+
+class ResolveProductsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="desserts")
+        self.products = []
+        for i, code in enumerate(
+            ['3017760290692', '0036000291452', '1234', '96385074']
+        ):
+            product = Product.objects.create(
+                code=code,
+                product_name=f"product {i}",
+                nutriscore_grade='abcd'[i],
+                nutriscore_score=i,
+            )
+            product.categories.add(self.category)
+            self.products.append(product)
+        ProductSubstitute.build()
+
+    def test_resolve_products_constant_number_of_queries(self):
+        """
+        Test that a batch of codes and id is resolved, in the order of the
+        request, with the substitutes, with a constant number of queries.
+        """
+        get_barcodes_map()
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('off_sub:ajax_resolve_products'),
+                {
+                    'codes': "036000291452,1234,5449000000996",
+                    'ids': [str(self.products[0].id), "x"],
+                    'nb_sub': 2,
+                }
+            )
+        data = response.json()
+        self.assertEqual(
+            [prod['id'] for prod in data['products']],
+            [self.products[1].id, self.products[2].id, self.products[0].id]
+        )
+        self.assertEqual(data['not_found'], ["5449000000996", "x"])
+        self.assertEqual(
+            [sub['id'] for sub in data['products'][0]['substitutes']],
+            [self.products[0].id, self.products[1].id]
+        )
+        self.assertEqual(
+            set(data['products'][0]['substitutes'][0]),
+            {'id', 'code', 'product_name', 'nutriscore_grade',
+             'nutriscore_score'}
+        )
+
+    def test_resolve_too_many_products(self):
+        """
+        Test that a too large batch is rejected.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_resolve_products'),
+            {'ids': ",".join(str(i) for i in range(101))}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_resolve_invalid_ids(self):
+        """
+        Test that the id with non-ASCII digits, or out of the range
+        of the id column, are not found.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_resolve_products'),
+            {'ids': ["²", "٣", str(2 ** 31), str(self.products[0].id)]}
+        )
+        data = response.json()
+        self.assertEqual(
+            [prod['id'] for prod in data['products']], [self.products[0].id]
+        )
+        self.assertEqual(data['not_found'], ["²", "٣", str(2 ** 31)])
+
+
+class SubstitutesTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="desserts")
+        self.products = []
+        for i in range(3):
+            product = Product.objects.create(
+                code=f'{i}' * 13,
+                product_name=f"product {i}",
+                nutriscore_grade='abc'[i],
+                nutriscore_score=i,
+            )
+            product.categories.add(self.category)
+            self.products.append(product)
+        ProductSubstitute.build()
+        self.url = reverse(
+            'off_sub:ajax_substitutes', args=[self.products[2].id]
+        )
+
+    def test_substitutes_with_caching_headers(self):
+        """
+        Test that the substitutes are returned with their ETag,
+        their date, and the headers for the shared caches.
+        """
+        response = self.client.get(self.url, {'nb_sub': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['product']['id'], self.products[2].id)
+        self.assertEqual(
+            [sub['id'] for sub in data['substitutes']],
+            [self.products[0].id, self.products[1].id]
+        )
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage=600', response['Cache-Control'])
+
+    def test_substitutes_not_modified(self):
+        """
+        Test that a conditional request (ETag or date) is answered
+        with a 304, without any database query.
+        """
+        response = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            etag_response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag']
+            )
+            date_response = self.client.get(
+                self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+            )
+        self.assertEqual(etag_response.status_code, 304)
+        self.assertEqual(date_response.status_code, 304)
+        self.assertIn('max-age=60', etag_response['Cache-Control'])
+
+    def test_substitutes_modified_after_catalogue_change(self):
+        """
+        Test that the ETag changes with the catalogue version,
+        and with the number of substitutes.
+        """
+        response = self.client.get(self.url)
+        other_response = self.client.get(self.url, {'nb_sub': 1})
+        self.assertNotEqual(response['ETag'], other_response['ETag'])
+        bump_catalogue_version()
+        new_response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(new_response.status_code, 200)
+        self.assertNotEqual(new_response['ETag'], response['ETag'])
+
+    def test_substitutes_unknown_product(self):
+        """
+        Test that an unknown product returns a 404.
+        """
+        response = self.client.get(
+            reverse('off_sub:ajax_substitutes', args=[0])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+class SaveUnsaveProductsTestCase(TestCase):
+
+    def setUp(self):
+        self.products = [
+            Product.objects.create(
+                code=f'{i}' * 13,
+                product_name=f"product {i}",
+                nutriscore_grade='a',
+                nutriscore_score=i,
+            )
+            for i in range(3)
+        ]
+        self.ids = [str(prod.id) for prod in self.products]
+        self.user = MyUser.objects.create_user(
+            email="toto@mail.com",
+            first_name="Toto"
+        )
+        self.client.force_login(self.user)
+
+    def test_save_and_unsave_products(self):
+        """
+        Test that several products are saved, then unsaved, at once.
+        """
+        response = self.client.post(
+            reverse('off_sub:ajax_save_products'),
+            {'product_ids': ",".join(self.ids + ["0"])}
+        )
+        data = response.json()
+        self.assertEqual(
+            data['product_ids'], [int(value) for value in self.ids]
+        )
+        self.assertEqual(data['not_found'], [0])
+        self.assertEqual(self.user.favorites.count(), 3)
+        response = self.client.post(
+            reverse('off_sub:ajax_unsave_products'),
+            {'product_ids': self.ids[:2]}
+        )
+        self.assertEqual(response.json()['deleted'], 2)
+        self.assertEqual(
+            list(self.user.favorites.all()), [self.products[2]]
+        )
+
+    def test_save_and_unsave_product(self):
+        """
+        Test that a product is saved, then unsaved, and that the invalid
+        or unknown product id are rejected (without server error).
+        """
+        for name, saved in (('save', True), ('unsave', False)):
+            url = reverse(f'off_sub:ajax_{name}_product')
+            response = self.client.post(url, {'product_id': self.ids[0]})
+            self.assertEqual(
+                response.json(), {'product_id': self.products[0].id}
+            )
+            self.assertEqual(self.user.favorites.exists(), saved)
+            for product_id in ("x", "²", str(2 ** 31), ""):
+                response = self.client.post(url, {'product_id': product_id})
+                self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            reverse('off_sub:ajax_save_product'), {'product_id': 0}
+        )
+        self.assertEqual(response.status_code, 404)
+        self.client.logout()
+        response = self.client.post(
+            reverse('off_sub:ajax_save_product'), {'product_id': self.ids[0]}
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.user.favorites.exists())
+
+    def test_set_favorite(self):
+        """
+        Test that the state of a favorite is set, and that repeating
+        the request changes nothing.
+        """
+        url = reverse('off_sub:ajax_set_favorite')
+        for changed in (True, False):
+            response = self.client.post(
+                url, {'product_id': self.ids[0], 'saved': "true"}
+            )
+            self.assertEqual(response.json(), {
+                'product_id': self.products[0].id,
+                'saved': True,
+                'changed': changed,
+            })
+        self.assertEqual(
+            list(self.user.favorites.all()), [self.products[0]]
+        )
+        response = self.client.post(url, {'product_id': 0, 'saved': "true"})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(url, {'product_id': self.ids[0]})
+        self.assertEqual(response.status_code, 400)
+        for product_id in ("²", str(2 ** 31)):
+            response = self.client.post(
+                url, {'product_id': product_id, 'saved': "true"}
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_save_products_invalid_requests(self):
+        """
+        Test that the invalid requests are rejected.
+        """
+        url = reverse('off_sub:ajax_save_products')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        for product_ids in ("1,x", "1,²", f"1,{2 ** 31}"):
+            response = self.client.post(url, {'product_ids': product_ids})
+            self.assertEqual(response.status_code, 400)
+        self.client.logout()
+        response = self.client.post(url, {'product_ids': self.ids})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.user.favorites.count(), 0)
@@ -0,0 +1,133 @@
+"""
+This module contains the unit tests related to
+the barcode lookup of the products (app 'off_sub').
+"""
+
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+
+from off_sub.barcodes import find_product_id, get_barcodes_map, \
+    normalize_barcode
+from off_sub.models import Product
+
+
+class NormalizeBarcodeTestCase(TestCase):
+
+    def test_valid_barcodes(self):
+        """
+        Test if the valid barcodes are normalized as GTIN-14.
+        """
+        self.assertEqual(normalize_barcode("3017760290692"), "03017760290692")
+        self.assertEqual(normalize_barcode("96385074"), "00000096385074")
+        self.assertEqual(
+            normalize_barcode(" 3 017760-290692 "), "03017760290692"
+        )
+
+    def test_upc_matches_ean13(self):
+        """
+        Test if a UPC-A code and its EAN-13 form are the same barcode.
+        """
+        self.assertEqual(
+            normalize_barcode("036000291452"),
+            normalize_barcode("0036000291452")
+        )
+
+    def test_invalid_barcodes(self):
+        """
+        Test if the barcodes with a wrong check digit or length,
+        or which are not numbers, are rejected.
+        """
+        self.assertIsNone(normalize_barcode("3017760290693"))
+        self.assertIsNone(normalize_barcode("301776029069"))
+        self.assertIsNone(normalize_barcode("1234567"))
+        self.assertIsNone(normalize_barcode("301776029069a"))
+        self.assertIsNone(normalize_barcode(""))
+        self.assertIsNone(normalize_barcode("30177602906²"))
+
+
+class BarcodesMapTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            code='3017760290692',
+            product_name="Napolitain",
+            nutriscore_grade='e',
+            nutriscore_score=19,
+        )
+
+    def test_lookup_without_query(self):
+        """
+        Test if a warm lookup does not hit the database.
+        """
+        get_barcodes_map()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                find_product_id("3017760290692"), self.product.id
+            )
+
+    def test_map_follows_catalogue_changes(self):
+        """
+        Test if the map is updated when the catalogue changes.
+        """
+        self.assertIsNone(find_product_id("036000291452"))
+        product = Product.objects.create(
+            code='0036000291452',
+            product_name="a product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+        self.assertEqual(find_product_id("036000291452"), product.id)
+        product.delete()
+        self.assertIsNone(find_product_id("036000291452"))
+
+    def test_find_barcode_view(self):
+        """
+        Test the answers of the barcode endpoint.
+        """
+        url = reverse('off_sub:ajax_find_barcode')
+        response = self.client.get(url, {'code': "3017760290692"})
+        self.assertEqual(response.json(), {'product_id': self.product.id})
+        response = self.client.get(url, {'code': "3017760290693"})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(url, {'code': "0036000291452"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_find_product_with_raw_barcode(self):
+        """
+        Test if a raw barcode submitted in the search form
+        finds the product.
+        """
+        response = self.client.post(
+            reverse('off_sub:ajax_find_product'),
+            {'product_string': "3017760290692"}
+        )
+        self.assertEqual(response.json(), {'product_id': self.product.id})
+
+    def test_exact_code_first_on_collision(self):
+        """
+        Test if the codes with the same GTIN-14 find their own product,
+        and if their GTIN-14 alone is ambiguous.
+        """
+        upc = Product.objects.create(
+            code='036000291452',
+            product_name="a UPC-A product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+        ean = Product.objects.create(
+            code='0036000291452',
+            product_name="an EAN-13 product",
+            nutriscore_grade='b',
+            nutriscore_score=1,
+        )
+        self.assertEqual(find_product_id("036000291452"), upc.id)
+        self.assertEqual(find_product_id("0036000291452"), ean.id)
+        self.assertIsNone(find_product_id("00036000291452"))
+        for product in (upc, ean):
+            response = self.client.post(
+                reverse('off_sub:ajax_find_product'),
+                {'product_string': str(product)}
+            )
+            self.assertEqual(response.json(), {'product_id': product.id})
@@ -0,0 +1,53 @@
+"""
+This module contains the unit tests related to
+the benchmark_queries custom command (app 'off_sub').
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from off_sub.indexes import get_extra_indexes
+from off_sub.models import Category, Product, ProductSubstitute
+
+
+class BenchmarkQueriesTestCase(TestCase):
+
+    def test_benchmark_queries(self):
+        """
+        Test if the query plans are written with and without the indexes,
+        and if the database is left unchanged.
+        """
+        stdout = StringIO()
+        call_command(
+            'benchmark_queries', '--products', '50', '--repeat', '1',
+            stdout=stdout
+        )
+        self.assertIn("=== avec index ===", stdout.getvalue())
+        self.assertIn("=== sans index ===", stdout.getvalue())
+        self.assertIn("product_grade_idx", stdout.getvalue())
+        self.assertIn("substituts (précalculés)", stdout.getvalue())
+        self.assertEqual(Product.objects.count(), 0)
+        self.assertEqual(Category.objects.count(), 0)
+        self.assertEqual(ProductSubstitute.objects.count(), 0)
+        # the indexes are restored
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Product._meta.db_table
+            )
+        for index in Product._meta.indexes:
+            self.assertIn(index.name, indexes)
+
+    def test_extra_indexes_by_vendor(self):
+        """
+        Test if the composite index of the categories applies to every
+        database, and the name search indexes only to PostgreSQL.
+        """
+        extra_indexes = get_extra_indexes(connection)
+        self.assertIn('off_sub_product_categ_categ_prod_idx', extra_indexes)
+        self.assertEqual(
+            'off_sub_product_name_trgm_idx' in extra_indexes,
+            connection.vendor == 'postgresql'
+        )
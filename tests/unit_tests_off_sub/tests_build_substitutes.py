@@ -0,0 +1,173 @@
+"""
+This module contains the unit tests related to
+the precomputed substitutes (app 'off_sub').
+"""
+
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase
+
+from off_sub.importer import ImportReport, delete_missing_products
+from off_sub.models import Category, Product, ProductSubstitute
+from off_sub.scoring import Catalogue
+
+
+class BuildSubstitutesTestCase(TestCase):
+
+    def setUp(self):
+        self.category_1 = Category.objects.create(name="Category #1")
+        self.category_2 = Category.objects.create(name="Category #2")
+        self.products = []
+        for i, grade in enumerate("abcde"):
+            product = Product.objects.create(
+                code=f'{i + 1}' * 13,
+                product_name=f"product {grade}",
+                nutriscore_grade=grade,
+                nutriscore_score=5 * i,
+            )
+            self.products.append(product)
+        # products a, b, c in category 1; products c, d, e in category 2
+        for product in self.products[:3]:
+            product.categories.add(self.category_1)
+        for product in self.products[2:]:
+            product.categories.add(self.category_2)
+        call_command('build_substitutes', stdout=StringIO())
+
+    def test_build_substitutes_share_a_category(self):
+        """
+        Test if the precomputed substitutes share (at least)
+        one category with the product.
+        """
+        for product in self.products:
+            precomputed = {
+                sub.substitute for sub in product.substitutes.all()
+            }
+            candidates = set(
+                Product.objects.filter(categories__products=product)
+            )
+            self.assertEqual(precomputed, candidates)
+
+    def test_build_substitutes_score_delta(self):
+        """
+        Test if the score delta is recorded for each substitute.
+        """
+        for sub in ProductSubstitute.objects.all():
+            self.assertEqual(
+                sub.score_delta,
+                sub.substitute.nutriscore_score
+                - sub.product.nutriscore_score
+            )
+
+    def test_get_best_subs_reads_precomputed_substitutes(self):
+        """
+        Test if the best substitutes are read in one query.
+        """
+        precomputed = [
+            sub.substitute
+            for sub in self.products[3].substitutes.order_by('rank')
+        ]
+        with self.assertNumQueries(1):
+            subs = list(self.products[3].get_best_subs(2))
+        self.assertEqual(subs, precomputed[:2])
+
+    def test_build_substitutes_for_one_category(self):
+        """
+        Test if the substitutes can be computed
+        for the products of some categories only.
+        """
+        ProductSubstitute.objects.all().delete()
+        ProductSubstitute.build([self.category_1])
+        prods_with_subs = set(
+            ProductSubstitute.objects.values_list('product_id', flat=True)
+        )
+        self.assertEqual(
+            prods_with_subs,
+            {product.id for product in self.products[:3]}
+        )
+
+
+class RebuildSubstitutesTestCase(TransactionTestCase):
+    """
+    The substitutes are computed again when the transactions
+    changing the products are committed.
+    """
+
+    def setUp(self):
+        self.category_1 = Category.objects.create(name="Category #1")
+        self.category_2 = Category.objects.create(name="Category #2")
+        self.products = []
+        with transaction.atomic():
+            for i, grade in enumerate("abcde"):
+                product = Product.objects.create(
+                    code=f'{i + 1}' * 13,
+                    product_name=f"product {grade}",
+                    nutriscore_grade=grade,
+                    nutriscore_score=5 * i,
+                )
+                self.products.append(product)
+            # products a, b, c in category 1; products c, d, e in category 2
+            for product in self.products[:3]:
+                product.categories.add(self.category_1)
+            for product in self.products[2:]:
+                product.categories.add(self.category_2)
+
+    def get_subs(self, product):
+        return [
+            sub.substitute for sub in product.substitutes.order_by('rank')
+        ]
+
+    def test_substitutes_rebuilt_when_categories_change(self):
+        """
+        Test if the precomputed substitutes of the products
+        of a category are computed again when this category changes,
+        once the transaction is committed (and kept until then).
+        """
+        with transaction.atomic():
+            self.products[0].categories.remove(self.category_1)
+            self.assertIn(self.products[0], self.get_subs(self.products[1]))
+        self.assertEqual(self.get_subs(self.products[1]), self.products[1:3])
+        self.assertEqual(self.get_subs(self.products[0]), [])
+        # a product still in another category gets its new substitutes
+        self.products[2].categories.remove(self.category_1)
+        self.assertEqual(self.get_subs(self.products[2]), self.products[2:])
+
+    def test_one_rebuild_per_transaction(self):
+        """
+        Test if the changes of a transaction are coalesced into one
+        rebuild, which loads the products of the impacted categories only.
+        """
+        other_category = Category.objects.create(name="Category #3")
+        Product.objects.create(
+            code='6' * 13,
+            product_name="another product",
+            nutriscore_grade='a',
+            nutriscore_score=0,
+        ).categories.add(other_category)
+        with mock.patch.object(
+            Catalogue, 'load', wraps=Catalogue.load
+        ) as load:
+            with transaction.atomic():
+                for product in self.products[:3]:
+                    product.nutriscore_score -= 20
+                    product.save()
+                self.products[3].categories.add(self.category_1)
+        self.assertEqual(load.call_count, 1)
+        catalogue, categs_id = Catalogue.load(*load.call_args[0])
+        self.assertEqual(
+            set(catalogue.ids), {product.id for product in self.products}
+        )
+        self.assertIn(self.products[0], self.get_subs(self.products[3]))
+
+    def test_no_rebuild_when_deleting_missing_products(self):
+        """
+        Test if deleting the products missing from an import does not
+        compute again the substitutes (they are built afterwards).
+        """
+        report = ImportReport()
+        report.codes = {product.code for product in self.products[:2]}
+        with mock.patch.object(Catalogue, 'load') as load:
+            self.assertEqual(delete_missing_products(report), 3)
+        self.assertEqual(load.call_count, 0)
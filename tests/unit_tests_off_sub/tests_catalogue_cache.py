@@ -0,0 +1,70 @@
+"""
+This module contains the unit tests related
+to the catalogue cache (app 'off_sub').
+"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from off_sub import catalogue_cache
+from off_sub.models import Category, Product, ProductSubstitute
+
+
+class CatalogueCacheTestCase(TransactionTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product_a = Product.objects.create(
+            code='1234567890123',
+            product_name="a superb product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+
+    def test_catalogue_version_changes_when_product_saved(self):
+        """
+        Test that the catalogue version changes when a product is saved.
+        """
+        old_version = catalogue_cache.get_catalogue_version()
+        self.product_a.product_name = "a renamed product"
+        self.product_a.save()
+        new_version = catalogue_cache.get_catalogue_version()
+        self.assertGreater(new_version, old_version)
+
+    def test_catalogue_version_changes_when_categories_changed(self):
+        """
+        Test that the catalogue version changes when
+        a category is linked to a product.
+        """
+        old_version = catalogue_cache.get_catalogue_version()
+        category = Category.objects.create(name="Category #1")
+        self.product_a.categories.add(category)
+        new_version = catalogue_cache.get_catalogue_version()
+        self.assertGreater(new_version, old_version)
+
+    def test_catalogue_version_changes_after_commit(self):
+        """
+        Test that the catalogue version changes once the transaction
+        is committed, after the substitutes are computed again.
+        """
+        category = Category.objects.create(name="Category #1")
+        old_version = catalogue_cache.get_catalogue_version()
+        versions = []
+        with mock.patch.object(
+            ProductSubstitute, 'rebuild',
+            side_effect=lambda *args: versions.append(
+                catalogue_cache.get_catalogue_version()
+            )
+        ):
+            with transaction.atomic():
+                self.product_a.categories.add(category)
+                self.assertEqual(
+                    catalogue_cache.get_catalogue_version(), old_version
+                )
+        self.assertEqual(versions, [old_version])
+        self.assertGreater(
+            catalogue_cache.get_catalogue_version(), old_version
+        )
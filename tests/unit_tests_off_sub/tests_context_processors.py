@@ -7,6 +7,7 @@ from django.test import TestCase
 from django.test.client import RequestFactory
 
 from off_sub import context_processors as off_sub_cp
+from off_sub.catalogue_cache import bump_catalogue_version
 from off_sub.models import Product
 
 
@@ -38,39 +39,11 @@ class ContextProcessorsTestCase(TestCase):
         rf = RequestFactory()
         self.request = rf.get('foo/')
 
-    def test_off_sub_cp_all_products_results_type_is_dict(self):
+    def test_off_sub_cp_catalogue_version(self):
         """
-        Test that the results is a dict.
+        Test that the catalogue version is returned as a string,
+        which follows the changes of the catalogue.
         """
-        context = off_sub_cp.pur_beurre_all_products(self.request)
-        self.assertIs(type(context), dict)
-
-    def test_off_sub_cp_all_products_value_type_is_list_of_strings(self):
-        """
-        Test that, in the returned dict, the value for key 'all_products',
-        is a list of strings.
-        """
-        context = off_sub_cp.pur_beurre_all_products(self.request)
-        result = True
-        try:
-            products_list = context['all_products']
-            for item in products_list:
-                result = (result and (type(item) is str))
-        except Exception:
-            result = False
-        self.assertTrue(result)
-
-    def test_off_sub_cp_all_products_really_all(self):
-        """
-        Test that all products are in the returned dict,
-        used as context in views.
-        """
-        # count the number of products in database
-        products_counter = len(Product.objects.all())
-        # count the number of products in the returned dict
-        context = off_sub_cp.pur_beurre_all_products(self.request)
-        context_value = context['all_products']  # str
-        # for one product, there are two double quotes
-        double_quotes_counter = context_value.count('\"')
-        # match
-        self.assertEqual(products_counter * 2, double_quotes_counter)
+        context = off_sub_cp.pur_beurre_catalogue_version(self.request)
+        version = bump_catalogue_version()
+        self.assertEqual(str(context['catalogue_version']), str(version))
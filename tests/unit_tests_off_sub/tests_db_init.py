@@ -3,12 +3,21 @@ This module contains the unit tests related to
 the db_init custom command (app 'off_sub').
 """
 
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
 from django.test import TestCase
 from unittest.mock import patch
 
+import requests
 from django.core.management import call_command
 
 from off_sub.models import Product, Category, Store
+from .tests_importer import make_item
 
 
 class MockCategory:
@@ -67,7 +76,7 @@ class MockRequestsGet:
         ]
     }
 
-    def __init__(self, url, params=None):
+    def __init__(self, url, params=None, **kwargs):
         self.status_code = 200
 
     def json(self):
@@ -78,11 +87,11 @@ class DatabaseInitializationTestCase(TestCase):
 
     @classmethod
     @patch(target='off_sub.models.Category', new=MockCategory)
-    @patch(target='requests.get', new=MockRequestsGet)
+    @patch(target='requests.Session.get', new=MockRequestsGet)
     def setUpClass(cls):
         super().setUpClass()
         # initialize the database
-        call_command('db_init')
+        call_command('db_init', stdout=StringIO())
         # get the products
         cls.all_products = Product.objects.all()
         cls.prod_a = cls.all_products[0]
@@ -246,3 +255,191 @@ class DatabaseInitializationTestCase(TestCase):
         Test if there are no store link to a product (if applicable).
         """
         self.assertEqual(len(self.prod_b.stores.all()), 0)
+
+
+class MockRequestsGetFailure:
+
+    def __init__(self, url, params=None, **kwargs):
+        raise requests.ConnectionError("network unreachable")
+
+
+class DatabaseInitializationFailureTestCase(TestCase):
+
+    @patch(target='off_sub.models.Category', new=MockCategory)
+    @patch(target='requests.Session.get', new=MockRequestsGetFailure)
+    def test_failed_category_is_reported(self):
+        """
+        Test if a category which cannot be fetched is reported,
+        without stopping the initialization.
+        """
+        stdout = StringIO()
+        stderr = StringIO()
+        call_command('db_init', stdout=stdout, stderr=stderr)
+        self.assertIn("échec du téléchargement", stderr.getvalue())
+        self.assertIn("Installation terminée !", stdout.getvalue())
+        self.assertEqual(Product.objects.count(), 0)
+
+
+class MockRequestsGetPaginated:
+
+    COUNT = 5
+
+    def __init__(self, url, params=None, **kwargs):
+        self.status_code = 200
+        query = dict(
+            param.split("=") for param in url.split("?")[1].split("&")
+        )
+        self.page = int(query.get("page", 1))
+        self.page_size = int(query["page_size"])
+
+    def json(self):
+        first = (self.page - 1) * self.page_size
+        last = min(first + self.page_size, self.COUNT)
+        return {
+            "count": self.COUNT,
+            "products": [
+                {
+                    "countries": "France",
+                    "code": f'{i:013d}',
+                    "nutriscore_grade": 'a',
+                    "nutriscore_score": i,
+                }
+                for i in range(first, last)
+            ]
+        }
+
+
+class DatabaseInitializationPaginationTestCase(TestCase):
+
+    @patch(target='requests.Session.get', new=MockRequestsGetPaginated)
+    def test_all_pages_imported(self):
+        """
+        Test if all the pages of products of a category are imported.
+        """
+        call_command('db_init', '--page-size', '2', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 5)
+
+    @patch(target='requests.Session.get', new=MockRequestsGetPaginated)
+    def test_max_products(self):
+        """
+        Test if no more than 'max_products' products
+        are imported per category.
+        """
+        call_command(
+            'db_init', '--page-size', '2', '--max-products', '3',
+            stdout=StringIO()
+        )
+        self.assertEqual(Product.objects.count(), 3)
+
+
+class DatabaseInitializationFromDumpTestCase(TestCase):
+
+    ITEMS = [
+        make_item(
+            '1234567890123', categories="Desserts, Crèmes glacées"
+        ),
+        make_item(
+            '3210987654321', categories_tags=["en:desserts", "en:cakes"]
+        ),
+        # not sold in France
+        make_item(
+            '1111111111111', categories="Desserts", countries="Italy"
+        ),
+        # none of the pre-selected categories
+        make_item('2222222222222', categories="Boissons"),
+    ]
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    @patch(target='off_sub.models.Category', new=MockCategory)
+    @patch(target='requests.Session.get', new=MockRequestsGetFailure)
+    def test_import_from_jsonl_gz_dump(self):
+        """
+        Test if the products are imported from a gzipped JSONL export,
+        without any HTTP request, and linked to their categories.
+        """
+        path = os.path.join(self.tmp_dir.name, "products.jsonl.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as dump:
+            for item in self.ITEMS:
+                dump.write(json.dumps(item) + "\n")
+            dump.write("\n")  # empty line
+        stdout = StringIO()
+        call_command('db_init', '--from-dump', path, stdout=stdout)
+        self.assertIn("Installation terminée !", stdout.getvalue())
+        self.assertEqual(
+            set(Product.objects.values_list('code', flat=True)),
+            {'1234567890123', '3210987654321'}
+        )
+        self.assertEqual(
+            Category.objects.get(name="desserts").products.count(), 2
+        )
+
+    @patch(target='off_sub.models.Category', new=MockCategory)
+    def test_import_from_csv_dump(self):
+        """
+        Test if the products are imported from a CSV export
+        (tab-separated), with their nutriments per 100g.
+        """
+        path = os.path.join(self.tmp_dir.name, "products.csv")
+        with open(path, "w", encoding="utf-8", newline="") as dump:
+            writer = csv.writer(dump, delimiter="\t")
+            writer.writerow([
+                "code", "product_name", "countries", "categories_tags",
+                "nutriscore_grade", "nutriscore_score", "stores",
+                "fat_100g", "sugars_100g",
+            ])
+            writer.writerow([
+                "1234567890123", "a cake", "France",
+                "en:snacks,en:desserts", "d", "15", "Store #1",
+                "28.5", "",
+            ])
+        call_command('db_init', '--from-dump', path, stdout=StringIO())
+        prod = Product.objects.get()
+        self.assertEqual(prod.nutriscore_score, 15)
+        self.assertEqual(prod.fat, "28.5g")
+        self.assertEqual(prod.sugars, "donnée inconnue")
+        self.assertEqual(prod.categories.get().name, "desserts")
+        self.assertEqual(prod.stores.get().name, "Store #1")
+
+
+class DatabaseInitializationSyncTestCase(TestCase):
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "products.jsonl")
+
+    def write_dump(self, items):
+        with open(self.path, "w", encoding="utf-8") as dump:
+            for item in items:
+                dump.write(json.dumps(item) + "\n")
+
+    @patch(target='off_sub.models.Category', new=MockCategory)
+    def test_sync_summary(self):
+        """
+        Test if a second import only updates the changed products,
+        deletes the missing ones, and reports the counts.
+        """
+        items = [
+            make_item(f'{i:013d}', categories="Desserts") for i in range(3)
+        ]
+        self.write_dump(items)
+        call_command('db_init', '--from-dump', self.path, stdout=StringIO())
+        items[0]["product_name"] = "a new name"
+        self.write_dump(items[:2])
+        stdout = StringIO()
+        call_command(
+            'db_init', '--from-dump', self.path, '--sync', stdout=stdout
+        )
+        self.assertIn(
+            "0 ajoutés, 1 mis à jour, 1 inchangés, 1 supprimés",
+            stdout.getvalue()
+        )
+        self.assertEqual(
+            list(Product.objects.order_by('code').values_list(
+                'product_name', flat=True
+            )),
+            ["a new name", "product 0000000000001"]
+        )
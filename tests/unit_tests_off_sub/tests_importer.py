@@ -0,0 +1,270 @@
+"""
+This module contains the unit tests related to
+the import pipeline of the catalogue (app 'off_sub').
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from off_sub.importer import ImportReport, delete_missing_products, \
+    import_products, match_categories, parse_nutrient
+from off_sub.models import Category, Product, Store
+
+
+def make_item(code, **kwargs):
+    """
+    Return a product as issued from Open Food Facts.
+    """
+    item = {
+        "countries": "France",
+        "code": code,
+        "product_name": f"product {code}",
+        "nutriscore_grade": 'b',
+        "nutriscore_score": 1,
+        "stores": "Store #1, Store #2",
+    }
+    item.update(kwargs)
+    return item
+
+
+class ImportProductsTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="desserts")
+
+    def test_import_products_constant_number_of_queries(self):
+        """
+        Test if a batch of products is recorded
+        with a constant number of queries.
+        """
+        items = [make_item(f'{i:013d}') for i in range(100)]
+        with self.assertNumQueries(10):
+            nb_products = import_products(items, self.category)
+        self.assertEqual(nb_products, 100)
+        self.assertEqual(self.category.products.count(), 100)
+        self.assertEqual(Store.objects.count(), 2)
+        self.assertEqual(Product.stores.through.objects.count(), 200)
+
+    def test_import_products_updates_existing_products(self):
+        """
+        Test if a product already recorded is updated, not duplicated.
+        """
+        import_products([make_item('1234567890123')], self.category)
+        import_products(
+            [make_item('1234567890123', nutriscore_score=3)],
+            self.category
+        )
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Product.objects.get().nutriscore_score, 3)
+
+    def test_import_products_filters_items(self):
+        """
+        Test if the products not sold in France,
+        or without nutriscore, are not recorded.
+        """
+        items = [
+            make_item('1111111111111', countries="Belgique"),
+            make_item('2222222222222'),
+        ]
+        del items[1]["nutriscore_grade"]
+        self.assertEqual(import_products(items, self.category), 0)
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_import_products_without_store(self):
+        """
+        Test if a product without any store is recorded without store.
+        """
+        import_products(
+            [make_item('1234567890123', stores="")],
+            self.category
+        )
+        self.assertEqual(Store.objects.count(), 0)
+        self.assertEqual(Product.objects.count(), 1)
+
+
+class IncrementalImportTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="desserts")
+        self.items = [make_item(f'{i:013d}') for i in range(10)]
+        import_products(self.items, self.category)
+
+    def test_unchanged_products_are_skipped(self):
+        """
+        Test if the unchanged products are skipped, without any update.
+        """
+        report = ImportReport()
+        with self.assertNumQueries(5):
+            import_products(self.items, self.category, report)
+        self.assertEqual(
+            (report.inserted, report.updated, report.skipped), (0, 0, 10)
+        )
+        self.assertFalse(report.changed)
+
+    def test_changed_products_are_updated(self):
+        """
+        Test if the changed products (fields and stores) are updated,
+        and the new ones inserted.
+        """
+        self.items[0]["nutriscore_score"] = 5
+        self.items[1]["stores"] = "Store #3"
+        self.items.append(make_item('9999999999999'))
+        report = ImportReport()
+        import_products(self.items, self.category, report)
+        self.assertEqual(
+            (report.inserted, report.updated, report.skipped), (1, 2, 8)
+        )
+        self.assertEqual(
+            Product.objects.get(code=self.items[0]["code"]).nutriscore_score,
+            5
+        )
+        self.assertEqual(
+            list(Product.objects.get(code=self.items[1]["code"]).stores
+                 .values_list('name', flat=True)),
+            ["Store #3"]
+        )
+
+    def test_delete_missing_products(self):
+        """
+        Test if the products which disappeared are deleted.
+        """
+        report = ImportReport()
+        import_products(self.items[:8], self.category, report)
+        self.assertEqual(delete_missing_products(report), 2)
+        self.assertEqual(report.deleted, 2)
+        self.assertEqual(Product.objects.count(), 8)
+        self.assertTrue(report.changed)
+
+
+class NutrimentsTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="desserts")
+
+    def test_parse_nutrient(self):
+        """
+        Test if the nutriments values are converted into grams.
+        """
+        self.assertEqual(parse_nutrient("3.5g"), 3.5)
+        self.assertAlmostEqual(parse_nutrient("200mg"), 0.2)
+        self.assertEqual(parse_nutrient("0,5 g"), 0.5)
+        self.assertIsNone(parse_nutrient("donnée inconnue"))
+        self.assertIsNone(parse_nutrient("12kcal"))
+
+    def test_import_products_nutriments_100g(self):
+        """
+        Test if the nutriments per 100g are recorded, in grams.
+        """
+        nutriments = {
+            "fat_value": 3.5,
+            "fat_unit": "g",
+            "salt_value": 200,
+            "salt_unit": "mg",
+        }
+        import_products(
+            [make_item('1234567890123', nutriments=nutriments)],
+            self.category
+        )
+        prod = Product.objects.get()
+        self.assertEqual(prod.fat_100g, 3.5)
+        self.assertAlmostEqual(prod.salt_100g, 0.2)
+        self.assertIsNone(prod.sugars_100g)
+        self.assertEqual(
+            Product.objects.filter(salt_100g__lt=0.5).count(), 1
+        )
+
+    def test_import_products_nutriments_per_serving(self):
+        """
+        Test if the values per 100g of Open Food Facts are recorded
+        rather than the values per serving.
+        """
+        nutriments = {
+            "fat_value": 7,
+            "fat_unit": "g",
+            "fat_100g": 23.3,
+            "sugars_value": 4,
+            "sugars_unit": "g",
+        }
+        import_products(
+            [make_item(
+                '1234567890123',
+                nutriments=nutriments,
+                nutrition_data_per="serving"
+            )],
+            self.category
+        )
+        prod = Product.objects.get()
+        self.assertEqual(prod.fat_100g, 23.3)
+        self.assertEqual(prod.sugars_100g, 4)
+
+    def test_backfill_nutriments(self):
+        """
+        Test if the command 'backfill_nutriments' sets the nutriments
+        per 100g of the products already recorded.
+        """
+        Product.objects.create(
+            code='1234567890123', product_name="product",
+            nutriscore_grade='a', nutriscore_score=0,
+            fat="20g", saturated_fat="donnée inconnue",
+            sugars="1.5g", salt="300mg",
+        )
+        call_command('backfill_nutriments', stdout=StringIO())
+        prod = Product.objects.get()
+        self.assertEqual(
+            (prod.fat_100g, prod.saturated_fat_100g, prod.sugars_100g),
+            (20, None, 1.5)
+        )
+        self.assertAlmostEqual(prod.salt_100g, 0.3)
+
+
+class MatchCategoriesTestCase(TestCase):
+
+    def setUp(self):
+        self.categories = [
+            Category.objects.create(name=name)
+            for name in ["desserts", "fromages", "legumes"]
+        ]
+
+    def test_match_categories_names_and_tags(self):
+        """
+        Test if the categories are matched on the names (case and accents
+        insensitive) and on the canonical tags of Open Food Facts.
+        """
+        item = make_item(
+            '1234567890123',
+            categories="Produits laitiers, Légumes",
+            categories_tags=["en:dairies", "en:cheeses", "en:desserts"],
+        )
+        self.assertEqual(
+            [categ.name for categ in match_categories(item, self.categories)],
+            ["desserts", "fromages", "legumes"]
+        )
+
+    def test_match_categories_tags_only(self):
+        """
+        Test if the categories are matched on the English tags only
+        (e.g. CSV export), and not on the tags of other categories with
+        a similar name ("en:legumes" are pulses, not vegetables).
+        """
+        item = make_item(
+            '1234567890123',
+            categories="Cheese",
+            categories_tags="en:dairies,en:cheeses,en:vegetables",
+        )
+        self.assertEqual(
+            [categ.name for categ in match_categories(item, self.categories)],
+            ["fromages", "legumes"]
+        )
+        item = make_item(
+            '1234567890123', categories_tags=["en:legumes", "en:lentils"]
+        )
+        self.assertEqual(match_categories(item, self.categories), [])
+
+    def test_match_categories_without_category(self):
+        """
+        Test if a product without any matching category is not matched.
+        """
+        item = make_item('1234567890123', categories="Fromages de chèvre")
+        self.assertEqual(match_categories(item, self.categories), [])
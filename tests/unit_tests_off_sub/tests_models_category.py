@@ -30,6 +30,16 @@ class CategoryTestCase(TestCase):
         category_0 = Category.objects.create(name="alcool")
         self.assertEqual(category_0.get_url_250_products(), "")
 
+    def test_get_url_products_with_page(self):
+        """
+        Test if the returned URL displays the requested page.
+        """
+        url = "https://fr.openfoodfacts.org/cgi/search.pl?" \
+            + "action=process&tagtype_0=categories" \
+            + "&tag_contains_0=contains&tag_0=desserts" \
+            + "&page_size=100&json=1&page=3"
+        self.assertEqual(self.category_1.get_url_products(3, 100), url)
+
     def test_add_category_to_db_one_new_record(self):
         """
         Test if one record has been added to the 'Category' table.
@@ -260,3 +260,87 @@ class ProductTestCase(TestCase):
         other_product = (sub_nutri_max <= best_of_other_nutri)
         # union statement
         self.assertTrue(bad_product and other_product)
+
+    def test_get_suggestions_prefix_first(self):
+        """
+        Test if the products whose name starts with the term
+        are suggested before the products whose name contains it.
+        """
+        self.create_4_other_products()
+        product_f = Product.objects.create(
+            code='6666666666666',
+            product_name="superb cake",
+            nutriscore_grade='c',
+            nutriscore_score=5,
+        )
+        suggestions = Product.get_suggestions("superb", 10)
+        self.assertEqual(
+            suggestions,
+            [str(product_f), str(self.product_a)]
+        )
+
+    def test_get_suggestions_with_code(self):
+        """
+        Test if a product can be suggested from the beginning of its code.
+        """
+        self.create_4_other_products()
+        suggestions = Product.get_suggestions("3333", 10)
+        self.assertEqual(suggestions, [str(self.product_c)])
+
+    def test_get_suggestions_limited(self):
+        """
+        Test if no more than 'nb_sugg' products are suggested.
+        """
+        self.create_4_other_products()
+        suggestions = Product.get_suggestions("product", 2)
+        self.assertEqual(len(suggestions), 2)
+
+    def test_get_suggestions_empty_term(self):
+        """
+        Test if no product is suggested for an empty term.
+        """
+        self.assertEqual(Product.get_suggestions("  ", 10), [])
+
+    def test_get_best_subs_constant_number_of_queries(self):
+        """
+        Test if the substitution program uses a constant number of queries
+        (lookup of the precomputed substitutes, then computation),
+        whatever the number of products in the categories.
+        """
+        for i in range(50):
+            product = Product.objects.create(
+                code=f'9{i:012d}',
+                product_name=f"product #{i}",
+                nutriscore_grade='c',
+                nutriscore_score=i,
+            )
+            product.categories.add(self.category_1, self.category_2)
+        with self.assertNumQueries(2):
+            subs = list(self.product_a.get_best_subs(6))
+        # no duplicate, although the products share two categories
+        self.assertEqual(len(subs), len(set(subs)))
+        self.assertEqual(subs[0], self.product_a)
+
+    def test_get_most_saved(self):
+        """
+        Test if the most saved healthy products come first,
+        from the counters of favorites.
+        """
+        products = []
+        for i, (grade, count) in enumerate(
+            [('a', 2), ('b', 5), ('e', 9), ('a', 0), ('b', 2)]
+        ):
+            products.append(Product.objects.create(
+                code=f'9{i:012d}',
+                product_name=f"product #{i}",
+                nutriscore_grade=grade,
+                nutriscore_score=i,
+                favorites_count=count,
+            ))
+        self.assertEqual(
+            list(Product.get_most_saved(10)),
+            [products[1], products[0], products[4]]
+        )
+        self.assertEqual(
+            list(Product.get_most_saved(1, grades=['e'])), [products[2]]
+        )
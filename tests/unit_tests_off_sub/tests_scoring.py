@@ -0,0 +1,178 @@
+"""
+This module contains the unit tests related to
+the scoring engine of the substitutes (app 'off_sub').
+"""
+
+from unittest import mock
+
+from django.test import TestCase
+
+from off_sub import scoring
+from off_sub.models import Category, Product, Store
+
+
+class ScoringTestCase(TestCase):
+
+    def setUp(self):
+        self.category_1 = Category.objects.create(name="Category #1")
+        self.category_2 = Category.objects.create(name="Category #2")
+        self.store = Store.objects.create(name="Store #1")
+
+    def create_product(self, code, nutriscore_score, categories, **kwargs):
+        product = Product.objects.create(
+            code=code,
+            product_name=f"product {code}",
+            nutriscore_grade='c',
+            nutriscore_score=nutriscore_score,
+            **kwargs
+        )
+        product.categories.add(*categories)
+        return product
+
+    def get_substitutes(self, product, nb_sub=6, popularity=False):
+        catalogue, categs_id = scoring.Catalogue.load()
+        row = list(catalogue.ids).index(product.id)
+        subs_rows = dict(
+            scoring.rank_substitutes(
+                catalogue, [row], nb_sub, popularity=popularity
+            )
+        )[row]
+        return [int(catalogue.ids[sub_row]) for sub_row in subs_rows]
+
+    def test_better_nutriscore_first(self):
+        """
+        Test if, with the same categories,
+        the best nutriscore comes first.
+        """
+        product = self.create_product('1', 10, [self.category_1])
+        better = self.create_product('2', 0, [self.category_1])
+        self.assertEqual(
+            self.get_substitutes(product),
+            [better.id, product.id]
+        )
+
+    def test_more_categories_in_common_first(self):
+        """
+        Test if, with the same nutriscore,
+        the product sharing more categories comes first.
+        """
+        product = self.create_product(
+            '1', 10, [self.category_1, self.category_2]
+        )
+        partial = self.create_product('2', 5, [self.category_1])
+        full = self.create_product(
+            '3', 5, [self.category_1, self.category_2]
+        )
+        subs = self.get_substitutes(product)
+        self.assertLess(subs.index(full.id), subs.index(partial.id))
+
+    def test_better_nutrients_first(self):
+        """
+        Test if, with the same nutriscore and categories,
+        the product with less fat, sugars and salt comes first.
+        """
+        product = self.create_product(
+            '1', 10, [self.category_1],
+            fat_100g=10, sugars_100g=10, salt_100g=1
+        )
+        fatter = self.create_product(
+            '2', 5, [self.category_1],
+            fat_100g=20, sugars_100g=10, salt_100g=1
+        )
+        leaner = self.create_product(
+            '3', 5, [self.category_1],
+            fat_100g=5, sugars_100g=10, salt_100g=0.5
+        )
+        self.assertEqual(
+            self.get_substitutes(product, 2),
+            [leaner.id, fatter.id]
+        )
+
+    def test_available_in_store_first(self):
+        """
+        Test if, everything else being equal,
+        the product sold in a store comes first.
+        """
+        product = self.create_product('1', 10, [self.category_1])
+        not_sold = self.create_product('2', 5, [self.category_1])
+        sold = self.create_product('3', 5, [self.category_1])
+        sold.stores.add(self.store)
+        self.assertEqual(
+            self.get_substitutes(product, 2),
+            [sold.id, not_sold.id]
+        )
+
+    def test_most_saved_first_with_popularity(self):
+        """
+        Test if, everything else being equal, the most saved product
+        comes first with the popularity tiebreak (only).
+        """
+        product = self.create_product('1', 10, [self.category_1])
+        less_saved = self.create_product(
+            '2', 5, [self.category_1], favorites_count=1
+        )
+        most_saved = self.create_product(
+            '3', 5, [self.category_1], favorites_count=20
+        )
+        better = self.create_product('4', 4, [self.category_1])
+        self.assertEqual(
+            self.get_substitutes(product, 3),
+            [better.id, less_saved.id, most_saved.id]
+        )
+        self.assertEqual(
+            self.get_substitutes(product, 3, popularity=True),
+            [better.id, most_saved.id, less_saved.id]
+        )
+        # also when the tie is on the last substitute kept
+        self.assertEqual(
+            self.get_substitutes(product, 2, popularity=True),
+            [better.id, most_saved.id]
+        )
+
+    def test_popularity_only_breaks_ties(self):
+        """
+        Test if the popularity does not reorder candidates whose scores
+        differ, however slightly.
+        """
+        product = self.create_product(
+            '1', 10, [self.category_1], fat_100g=10
+        )
+        better = self.create_product(
+            '2', 5, [self.category_1], fat_100g=9.99
+        )
+        most_saved = self.create_product(
+            '3', 5, [self.category_1], fat_100g=10, favorites_count=1000
+        )
+        self.assertEqual(
+            self.get_substitutes(product, 2, popularity=True),
+            [better.id, most_saved.id]
+        )
+
+    def test_no_category_no_substitute(self):
+        """
+        Test if a product without category has no substitute.
+        """
+        product = self.create_product('1', 10, [])
+        self.create_product('2', 5, [self.category_1])
+        self.assertEqual(self.get_substitutes(product), [])
+
+    def test_same_substitutes_whatever_the_chunks(self):
+        """
+        Test if the products scored in several chunks (the chunk size
+        depends on the number of candidates) get the same substitutes.
+        """
+        products = [
+            self.create_product(
+                str(code), code % 7, [self.category_1],
+                fat_100g=code % 5, salt_100g=None if code % 3 else 1
+            )
+            for code in range(1, 11)
+        ]
+        catalogue, categs_id = scoring.Catalogue.load()
+        rows = list(range(len(products)))
+        expected = dict(scoring.rank_substitutes(catalogue, rows, 3))
+        # one product at a time (10 candidates)
+        with mock.patch.object(scoring, 'CELLS_BUDGET', 10):
+            chunked = dict(scoring.rank_substitutes(catalogue, rows, 3))
+        for row in rows:
+            self.assertEqual(list(chunked[row]), list(expected[row]))
@@ -0,0 +1,66 @@
+"""
+This module contains the unit tests related to
+the full-text search of the products (app 'off_sub').
+"""
+
+from unittest import skipIf
+
+from django.db import connection
+from django.test import TestCase
+
+from off_sub.models import Product
+from off_sub.search import search_products
+
+
+class SearchProductsTestCase(TestCase):
+
+    def setUp(self):
+        names = [
+            "Yaourt à la fraise",
+            "Fraise des bois, yaourt",
+            "Mousse au chocolat",
+            "Yaourt nature",
+        ]
+        self.products = [
+            Product.objects.create(
+                code=f'{i + 1}' * 13,
+                product_name=name,
+                nutriscore_grade='b',
+                nutriscore_score=i,
+            )
+            for i, name in enumerate(names)
+        ]
+
+    def test_search_all_words(self):
+        """
+        Test if only the products matching all the words are returned.
+        """
+        self.assertEqual(
+            set(search_products("yaourt fraise")),
+            {self.products[0], self.products[1]}
+        )
+
+    @skipIf(connection.vendor == 'postgresql', "SQLite fallback only")
+    def test_search_ranked_matches(self):
+        """
+        Test if the names starting with the term come first
+        (fallback of the full-text search).
+        """
+        self.assertEqual(
+            list(search_products("yaourt")),
+            [self.products[0], self.products[3], self.products[1]]
+        )
+
+    def test_search_barcode(self):
+        """
+        Test if a barcode (or its beginning) finds the product.
+        """
+        self.assertEqual(
+            list(search_products("3333")), [self.products[2]]
+        )
+
+    def test_search_empty_term(self):
+        """
+        Test if an empty term does not return any product.
+        """
+        self.assertEqual(list(search_products("  ")), [])
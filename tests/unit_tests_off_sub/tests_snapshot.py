@@ -0,0 +1,158 @@
+"""
+This module contains the unit tests related to
+the snapshots of the catalogue (app 'off_sub').
+"""
+
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase
+
+from off_sub.models import Category, Product, ProductSubstitute, Store
+from off_sub.snapshot import iter_fixture, iter_json_array, load_catalogue, \
+    open_snapshot
+
+
+class IterJsonArrayTestCase(TestCase):
+
+    def test_iter_json_array_by_small_chunks(self):
+        """
+        Test if the items of a JSON array are all yielded,
+        even when they are split across several chunks.
+        """
+        stream = StringIO(
+            ' [{"a": 1, "b": [1, 2]},\n {"a": "x, ]"} , {}]'
+        )
+        self.assertEqual(
+            list(iter_json_array(stream, chunk_size=4)),
+            [{"a": 1, "b": [1, 2]}, {"a": "x, ]"}, {}]
+        )
+
+    def test_iter_json_array_not_an_array(self):
+        """
+        Test if a JSON document which is not an array is rejected.
+        """
+        with self.assertRaises(ValueError):
+            list(iter_json_array(StringIO('{"a": 1}')))
+
+
+class CatalogueSnapshotTestCase(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(name="desserts")
+        self.store = Store.objects.create(name="Store #1")
+        for i, grade in enumerate("abc"):
+            prod = Product.objects.create(
+                code=f'{i}' * 13,
+                product_name=f"product {i} (crème brûlée)",
+                nutriscore_grade=grade,
+                nutriscore_score=i,
+                fat="1.5g",
+                url=f"url_{i}",
+            )
+            prod.categories.add(self.category)
+            if i:
+                prod.stores.add(self.store)
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.path = os.path.join(tmp_dir.name, "catalogue.jsonl.gz")
+
+    def test_dump_and_load_snapshot(self):
+        """
+        Test if a snapshot restores the whole catalogue,
+        and the precomputed substitutes.
+        """
+        products = list(Product.objects.order_by('id').values())
+        call_command(
+            'dump_catalogue_snapshot', self.path, stdout=StringIO()
+        )
+        Product.objects.all().delete()
+        Store.objects.all().delete()
+        Category.objects.all().delete()
+        call_command(
+            'load_catalogue_snapshot', self.path, stdout=StringIO()
+        )
+        self.assertEqual(
+            list(Product.objects.order_by('id').values()), products
+        )
+        self.assertEqual(
+            list(self.store.products.order_by('id').values_list(
+                'product_name', flat=True
+            )),
+            ["product 1 (crème brûlée)", "product 2 (crème brûlée)"]
+        )
+        self.assertEqual(self.category.products.count(), 3)
+        self.assertEqual(
+            ProductSubstitute.objects.values('product').distinct().count(),
+            3
+        )
+
+    def test_load_snapshot_updates_existing_records(self):
+        """
+        Test if loading a snapshot again restores the changed records,
+        without duplicating them.
+        """
+        call_command(
+            'dump_catalogue_snapshot', self.path, stdout=StringIO()
+        )
+        Product.objects.filter(code='0' * 13).update(nutriscore_score=10)
+        call_command(
+            'load_catalogue_snapshot', self.path, stdout=StringIO()
+        )
+        self.assertEqual(Product.objects.count(), 3)
+        self.assertEqual(
+            Product.objects.get(code='0' * 13).nutriscore_score, 0
+        )
+
+
+class LoadFixtureTestCase(TestCase):
+
+    def test_load_fixture(self):
+        """
+        Test if the Django fixture of the catalogue is loaded.
+        """
+        path = os.path.join(
+            settings.BASE_DIR, "off_sub", "dumps", "off_sub.json"
+        )
+        with open_snapshot(path, "r") as stream:
+            counters = load_catalogue(iter_fixture(stream))
+        self.assertEqual(
+            counters, {'category': 9, 'store': 186, 'product': 2085}
+        )
+        prod = Product.objects.get(code='3017760290692')
+        self.assertEqual(prod.product_name, "Napolitain")
+        self.assertEqual(
+            sorted(prod.stores.values_list('id', flat=True)), [1, 2, 3]
+        )
+        self.assertEqual(
+            list(prod.categories.values_list('name', flat=True)),
+            ["desserts"]
+        )
+
+    def test_load_fixture_again_keeps_the_new_columns(self):
+        """
+        Test if loading the Django fixture again (without the columns
+        added since) keeps the nutriments per 100g and the hashes.
+        """
+        path = os.path.join(
+            settings.BASE_DIR, "off_sub", "dumps", "off_sub.json"
+        )
+        with open_snapshot(path, "r") as stream:
+            load_catalogue(iter_fixture(stream))
+        Product.objects.filter(code='3017760290692').update(
+            content_hash="x" * 40
+        )
+        nb_products = Product.objects.filter(fat_100g__isnull=False).count()
+        self.assertGreater(nb_products, 2000)
+        with open_snapshot(path, "r") as stream:
+            load_catalogue(iter_fixture(stream))
+        self.assertEqual(
+            Product.objects.filter(fat_100g__isnull=False).count(),
+            nb_products
+        )
+        self.assertEqual(
+            Product.objects.get(code='3017760290692').content_hash, "x" * 40
+        )
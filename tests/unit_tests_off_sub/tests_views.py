@@ -2,12 +2,15 @@
 This module contains the unit tests related to the views (app 'off_sub').
 """
 
+from django.core.cache import cache
 from django.urls import reverse
-from django.test import RequestFactory, TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.contrib.auth.models import AnonymousUser
 
 from auth.models import MyUser
 from off_sub import views
+from off_sub.catalogue_cache import bump_catalogue_version, \
+    get_cache_stats
 from off_sub.models import Product
 
 
@@ -32,6 +35,48 @@ class FavoritesPageTestCase(TestCase):
         response = views.favorites(request)
         self.assertEqual(response.status_code, 200)
 
+    def test_favorites_page_sorted_filtered_and_paginated(self):
+        """
+        Test that favorites page displays a bounded page of the filtered
+        favorites, with a link to the next page.
+        """
+        for i in range(14):
+            product = Product.objects.create(
+                code=f'{i:013d}',
+                product_name=f"product {i}",
+                nutriscore_grade='a' if i < 13 else 'b',
+                nutriscore_score=i,
+            )
+            self.user.favorites.add(product)
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse('off_sub:favorites'),
+            {'sort': 'nutriscore', 'grade': 'a'}
+        )
+        self.assertEqual(response.context['favorites_count'], 13)
+        products = response.context['products_list']
+        self.assertEqual(
+            [prod.product_name for prod in products[:2]],
+            ["product 0", "product 1"]
+        )
+        self.assertEqual(len(products), 12)
+        response = self.client.get(
+            reverse('off_sub:favorites') + "?"
+            + response.context['next_query']
+        )
+        self.assertEqual(
+            [prod.product_name for prod in response.context['products_list']],
+            ["product 12"]
+        )
+        self.assertNotIn('next_query', response.context)
+        # the invalid id are ignored
+        response = self.client.get(
+            reverse('off_sub:favorites'),
+            {'after': "²", 'category': str(2 ** 31)}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['favorites_count'], 14)
+
     def test_favorites_page_returns_302_with_no_user(self):
         """
         Test that favorites page returns a 302 code if no user is logged in.
@@ -90,6 +135,25 @@ class IndexPageTestCase(TestCase):
         response = self.client.get(reverse('off_sub:index'))
         self.assertEqual(response.status_code, 200)
 
+    def test_index_page_displays_most_saved_products(self):
+        """
+        Test that index page displays the most saved healthy products.
+        """
+        for i, (grade, count) in enumerate([('a', 2), ('b', 5), ('e', 9)]):
+            Product.objects.create(
+                code=f'{i:013d}',
+                product_name=f"product {grade}",
+                nutriscore_grade=grade,
+                nutriscore_score=i,
+                favorites_count=count,
+            )
+        response = self.client.get(reverse('off_sub:index'))
+        self.assertEqual(
+            [prod.product_name for prod in response.context['most_saved']],
+            ["product b", "product a"]
+        )
+        self.assertContains(response, "product b")
+
 
 class LegalPageTestCase(TestCase):
 
@@ -136,3 +200,182 @@ class ResultsPageTestCase(TestCase):
             args=(product_id,)
         ))
         self.assertEqual(response.status_code, 404)
+
+
+class AnonymousPageCacheTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            code='1234567890123',
+            product_name="a superb product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+        self.url = reverse('off_sub:results', args=(self.product.id,))
+        self.user = MyUser.objects.create_user(
+            email="toto@mail.com",
+            first_name="Toto"
+        )
+
+    def test_anonymous_page_served_from_cache(self):
+        """
+        Test that the page of a product is cached for the anonymous users,
+        and that the CSRF cookie is still set for the new visitors.
+        """
+        self.client.get(self.url)
+        self.client.cookies.clear()
+        with self.assertNumQueries(0):
+            cached_response = self.client.get(self.url)
+        self.assertEqual(cached_response.status_code, 200)
+        self.assertContains(cached_response, "a superb product")
+        self.assertIn('csrftoken', cached_response.cookies)
+
+    def test_anonymous_page_cached_without_csrf_token(self):
+        """
+        Test that the CSRF token of the first visitor is not cached.
+        """
+        response = self.client.get(self.url)
+        token = response.cookies['csrftoken'].value
+        self.client.cookies.clear()
+        cached_response = self.client.get(self.url)
+        self.assertNotIn(token, cached_response.content.decode())
+        self.assertContains(
+            cached_response,
+            'name="csrfmiddlewaretoken" value=""'
+        )
+
+    def test_anonymous_page_cached_by_next_url(self):
+        """
+        Test that the cached pages are keyed by the parameter 'next',
+        and that the requests with other parameters are not cached.
+        """
+        self.client.get(self.url + "?next=/")
+        old_stats = get_cache_stats()
+        self.client.get(self.url + "?next=/")
+        self.client.get(self.url + "?next=/&utm_source=mail")
+        new_stats = get_cache_stats()
+        self.assertEqual(new_stats['page_hits'], old_stats['page_hits'] + 1)
+        self.assertEqual(new_stats['page_misses'], old_stats['page_misses'])
+
+    def test_anonymous_page_purged_after_product_change(self):
+        """
+        Test that the cached page is no longer used when the product
+        changes.
+        """
+        self.client.get(self.url)
+        self.product.product_name = "a new name"
+        self.product.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, "a new name")
+
+    def test_authenticated_page_not_cached(self):
+        """
+        Test that the pages of the authenticated users are neither
+        cached nor served from the cache.
+        """
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        old_stats = get_cache_stats()
+        response = self.client.get(self.url)
+        new_stats = get_cache_stats()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(new_stats['page_hits'], old_stats['page_hits'])
+        self.assertEqual(new_stats['page_misses'], old_stats['page_misses'])
+
+
+class ProductCardCacheTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            code='1234567890123',
+            product_name="a superb product",
+            nutriscore_grade='a',
+            nutriscore_score=-1,
+        )
+        self.url = reverse('off_sub:search') + "?q=superb"
+        self.user = MyUser.objects.create_user(
+            email="toto@mail.com",
+            first_name="Toto"
+        )
+        self.client.force_login(self.user)
+
+    def test_product_card_cached_until_catalogue_change(self):
+        """
+        Test that the cards are cached for the current catalogue version.
+        """
+        self.client.get(self.url)
+        # the bulk updates do not send signals: the version is unchanged
+        Product.objects.filter(id=self.product.id).update(
+            product_name="a superb new name"
+        )
+        self.assertContains(self.client.get(self.url), "a superb product")
+        bump_catalogue_version()
+        self.assertContains(self.client.get(self.url), "a superb new name")
+
+    def test_product_card_shared_by_the_pages(self):
+        """
+        Test that a cached card is used on any page, with the link
+        to the product following the current page.
+        """
+        self.client.get(self.url)
+        Product.objects.filter(id=self.product.id).update(
+            product_name="a superb new name"
+        )
+        response = self.client.get(self.url + "&page=1")
+        self.assertContains(response, "a superb product")
+        self.assertContains(
+            response,
+            f'href="/food/{self.product.id}?next=/search/?q=superb&amp;page=1"'
+        )
+
+    def test_favorite_button_not_cached(self):
+        """
+        Test that the button of a cached card follows the user's favorites.
+        """
+        self.assertContains(self.client.get(self.url), "Sauvegarder")
+        self.user.favorites.add(self.product)
+        content = self.client.get(self.url).content.decode()
+        # the displayed button ('d-block') comes first
+        self.assertLess(
+            content.index("unsaveProduct"),
+            content.index("btn-outline-success saveProduct")
+        )
+
+
+class SearchPageTestCase(TestCase):
+
+    def setUp(self):
+        for i in range(15):
+            Product.objects.create(
+                code=f'{i:013d}',
+                product_name=f"crème dessert {i}",
+                nutriscore_grade='c',
+                nutriscore_score=i,
+            )
+
+    def test_search_page_returns_paginated_matches(self):
+        """
+        Test that search page returns the matching products,
+        12 per page.
+        """
+        response = self.client.get(
+            reverse('off_sub:search'), {'q': "dessert"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page'].paginator.count, 15)
+        self.assertEqual(len(response.context['products_list']), 12)
+        response = self.client.get(
+            reverse('off_sub:search'), {'q': "dessert", 'page': 2}
+        )
+        self.assertEqual(len(response.context['products_list']), 3)
+
+    def test_search_page_without_match(self):
+        """
+        Test that search page returns a 200 code without any match.
+        """
+        response = self.client.get(
+            reverse('off_sub:search'), {'q': "pizza"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Aucun produit")